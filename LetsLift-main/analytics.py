@@ -0,0 +1,156 @@
+"""Vectorized per-exercise trend analytics for the history page.
+
+A user's exercise history is loaded once into columnar NumPy arrays and
+every statistic (volume per week, estimated one-rep max, weekly rollups,
+rolling averages) is computed with array operations instead of Python
+loops, so the page stays fast with years of data.
+
+NumPy is optional: without it get_trends() returns None and the page
+simply leaves out the trends section.
+"""
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from db import get_db
+
+WEEKS_SHOWN = 12
+ROLLING_WEEKS = 4
+TOP_EXERCISES = 5
+
+def load_columns(user_id):
+    """Load a user's exercise history as parallel NumPy arrays."""
+    with get_db() as db:
+        cursor = db.cursor()
+        # Plain tuples are much cheaper to build than sqlite3.Row objects
+        cursor.row_factory = None
+        rows = cursor.execute(
+            # Days since 1970-01-01 (julianday 2440587.5), computed in SQLite
+            'SELECT CAST(julianday(substr(w.started_at, 1, 10)) - 2440587.5 AS INTEGER), '
+            'e.name, e.weight_lbs, e.is_bodyweight, e.sets, e.reps '
+            'FROM exercises e JOIN workouts w ON w.id = e.workout_id '
+            'WHERE w.user_id = ? AND w.started_at IS NOT NULL',
+            (user_id,)
+        ).fetchall()
+    if not rows:
+        return None
+
+    days, names, weights, bodyweight, sets, reps = zip(*rows)
+    codes = {}
+    name_codes = np.fromiter((codes.setdefault(name, len(codes)) for name in names),
+                             dtype=np.int64, count=len(names))
+    return {
+        'day': np.array(days, dtype=np.int64).astype('datetime64[D]'),
+        'exercise': name_codes,
+        'names': list(codes),
+        'weight': np.array(weights, dtype=np.float64),
+        'bodyweight': np.array(bodyweight, dtype=bool),
+        'sets': np.array(sets, dtype=np.float64),
+        'reps': np.array(reps, dtype=np.float64),
+    }
+
+def week_index(days):
+    """Monday-based week number; week 0 starts Monday 1969-12-29."""
+    return (days.astype(np.int64) + 3) // 7
+
+def estimated_1rm(weight, reps):
+    """Epley estimate of the one-rep max; 0 where it isn't meaningful."""
+    e1rm = weight * (1 + reps / 30.0)
+    return np.where((weight > 0) & (reps > 0), e1rm, 0.0)
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` points (shorter at the start) along the last axis."""
+    cumulative = np.cumsum(values, axis=-1)
+    shifted = np.zeros_like(cumulative)
+    shifted[..., window:] = cumulative[..., :-window]
+    counts = np.minimum(np.arange(1, values.shape[-1] + 1), window)
+    return (cumulative - shifted) / counts
+
+def compute_trends(columns, today=None, weeks=WEEKS_SHOWN, window=ROLLING_WEEKS, top=TOP_EXERCISES):
+    """Weekly rollups and per-exercise trends over the last `weeks` weeks."""
+    today = np.datetime64(today or date.today(), 'D')
+    current_week = int(week_index(np.array([today]))[0])
+    first_week = current_week - weeks + 1
+
+    volume = np.where(columns['bodyweight'], 0.0, columns['weight'] * columns['sets'] * columns['reps'])
+    e1rm = np.where(columns['bodyweight'], 0.0, estimated_1rm(columns['weight'], columns['reps']))
+    week = week_index(columns['day'])
+    exercise = columns['exercise']
+    n_exercises = len(columns['names'])
+
+    # Weekly rollups across all exercises (rolling averages need the weeks
+    # before the shown range, so roll up `window` extra weeks first)
+    span = weeks + window - 1
+    recent = week >= first_week - window + 1
+    slot = week[recent] - (first_week - window + 1)
+    in_span = slot < span
+    slot, rec_exercise = slot[in_span], exercise[recent][in_span]
+    rec_volume, rec_e1rm = volume[recent][in_span], e1rm[recent][in_span]
+    rec_sets = columns['sets'][recent][in_span]
+
+    weekly_volume = np.bincount(slot, weights=rec_volume, minlength=span)
+    weekly_sets = np.bincount(slot, weights=rec_sets, minlength=span)
+
+    grid = rec_exercise * span + slot
+    exercise_weekly_volume = np.bincount(grid, weights=rec_volume, minlength=n_exercises * span).reshape(n_exercises, span)
+    exercise_weekly_e1rm = np.zeros(n_exercises * span)
+    np.maximum.at(exercise_weekly_e1rm, grid, rec_e1rm)
+    exercise_weekly_e1rm = exercise_weekly_e1rm.reshape(n_exercises, span)
+    exercise_rolling = rolling_mean(exercise_weekly_volume, window)
+
+    total_volume = np.bincount(exercise, weights=volume, minlength=n_exercises)
+    best_e1rm = np.zeros(n_exercises)
+    np.maximum.at(best_e1rm, exercise, e1rm)
+
+    shown = slice(window - 1, None)
+    week_starts = [
+        (date(1969, 12, 29) + timedelta(weeks=first_week + i)).isoformat()
+        for i in range(weeks)
+    ]
+    peak = weekly_volume[shown].max() or 1.0
+
+    ranked = np.argsort(-total_volume, kind='stable')[:top]
+    exercises = []
+    for code in ranked:
+        if total_volume[code] <= 0 and best_e1rm[code] <= 0:
+            continue
+        rolling = exercise_rolling[code]
+        previous = rolling[-window - 1] if span > window else 0.0
+        change = (rolling[-1] - previous) / previous * 100 if previous > 0 else None
+        recent_e1rm = exercise_weekly_e1rm[code][shown]
+        exercises.append({
+            'name': columns['names'][code],
+            'total_volume': round(float(total_volume[code]), 1),
+            'best_e1rm': round(float(best_e1rm[code]), 1),
+            'recent_e1rm': round(float(recent_e1rm.max()), 1),
+            'weekly_volume': [round(float(v), 1) for v in exercise_weekly_volume[code][shown]],
+            'rolling_volume': round(float(rolling[-1]), 1),
+            'volume_change_pct': None if change is None else round(float(change), 1),
+        })
+
+    return {
+        'weeks': [
+            {
+                'start': start,
+                'volume': round(float(v), 1),
+                'sets': int(s),
+                'rolling_volume': round(float(r), 1),
+                'height_pct': round(float(v / peak * 100), 1),
+            }
+            for start, v, s, r in zip(week_starts, weekly_volume[shown], weekly_sets[shown],
+                                      rolling_mean(weekly_volume, window)[shown])
+        ],
+        'exercises': exercises,
+    }
+
+def get_trends(user_id, today=None):
+    """Trends for the /history page, or None without NumPy or history."""
+    if np is None:
+        return None
+    columns = load_columns(user_id)
+    if columns is None:
+        return None
+    return compute_trends(columns, today=today)
@@ -1,14 +1,55 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from datetime import datetime
-import sqlite3
-from contextlib import contextmanager
-import json
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, flash,
+                   get_flashed_messages, session, g, Response, stream_with_context)
+from datetime import MAXYEAR, MINYEAR, datetime
+from functools import partial
+import logging
 import os
+import time
+import io
+import data_version
+import events
+import exercise_names
+import history_cache
+import history_io
+import metrics
+import page_cache
+from analytics import get_trends
+from db import get_db, init_db, is_bad_weight, parse_weight, to_iso
+from drafts import add_draft_exercises, discard_draft, load_draft, pop_draft_exercise, start_draft
+from services import message_queue
+from services.feed_store import MAX_PAGE_SIZE
+from services.notifications import get_recent_notifications, get_unread_count, mark_all_read, mark_read
+from services.progress import get_stats as get_progress_stats
+from services.social import follow, get_following, get_timeline, unfollow
+from logs import setup_logging
+from leaderboards import TOP_K, get_leaderboard, update_leaderboards
+from records import get_records, update_records
+from rollups import get_heatmap, get_range, update_rollups
+from search import PAGE_SIZE as SEARCH_PAGE_SIZE, index_workout, search_workouts
+from services.streak import get_streak
 
 app = Flask(__name__)
-app.secret_key = 'dev'
 app.config['SESSION_TYPE'] = 'filesystem'
-app.debug = True
+# LETSLIFT_ENV=production (set by gunicorn.conf.py) turns debug mode off
+app.debug = os.environ.get('LETSLIFT_ENV', 'development') != 'production'
+# Sessions carry the user id, so production must not sign them with a known key
+app.secret_key = os.environ.get('LETSLIFT_SECRET_KEY')
+if not app.secret_key:
+    if not app.debug:
+        raise RuntimeError('LETSLIFT_SECRET_KEY must be set when LETSLIFT_ENV=production')
+    app.secret_key = 'dev'
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Workouts per page on /history
+HISTORY_PAGE_SIZE = 20
+# Newest notifications and timeline posts shown on /history
+NOTIFICATIONS_SHOWN = 5
+TIMELINE_SHOWN = 5
+LEADERBOARD_SHOWN = 5
+# Default page size of /notifications and /timeline
+FEED_PAGE_SIZE = 20
 
 WORKOUT_TEMPLATES = {
     'Beginner Upper Body': [
@@ -23,98 +64,182 @@ WORKOUT_TEMPLATES = {
     ]
 }
 
+# Template spellings are the canonical names for autocomplete
+exercise_names.SEED_NAMES.extend(
+    exercise['name'] for template in WORKOUT_TEMPLATES.values() for exercise in template)
+
 # Simplified service communication
 def write_to_service(service_name, data):
-    """Write data to a service's input file"""
+    """Queue data for a service"""
     try:
-        filename = f'data/{service_name}_input.txt'
-        with open(filename, 'w') as f:
-            json.dump(data, f)
-        print(f"Data sent to {service_name} service")
+        message_queue.publish(service_name, data)
+        logger.debug("Data sent to %s service", service_name)
     except Exception as e:
-        print(f"Error writing to {service_name} service: {e}")
+        logger.error("Error writing to %s service: %s", service_name, e)
+        raise
 
-def read_from_service(service_name):
-    """Read data from a service's output file"""
-    try:
-        filename = f'data/{service_name}_output.txt'
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error reading from {service_name} service: {e}")
-    return None
+# Handlers for a saved workout, run off the request path by events.dispatch()
+@events.on('workout_completed')
+def update_streak_service(event):
+    # 1. Update Streak (Microservice A)
+    write_to_service('streak', {
+        'user_id': event['user_id'],
+        'date': event['date']
+    })
 
-@contextmanager
-def get_db():
-    db = sqlite3.connect('workouts.db')
-    db.row_factory = sqlite3.Row
-    try:
-        yield db
-    finally:
-        db.close()
+@events.on('workout_completed')
+def post_to_social_service(event):
+    # 2. Create Social Post (Microservice B)
+    exercises_summary = ", ".join([ex['name'] for ex in event['exercises']])
+    write_to_service('social', {
+        'user_id': event['user_id'],
+        'content': f'Completed a workout! 💪 Exercises: {exercises_summary}'
+    })
 
-def init_db():
-    with get_db() as db:
-        db.execute('''
-        CREATE TABLE IF NOT EXISTS workouts (
-            id INTEGER PRIMARY KEY,
-            start_time TEXT,
-            end_time TEXT,
-            notes TEXT
-        )''')
-        
-        db.execute('''
-        CREATE TABLE IF NOT EXISTS exercises (
-            id INTEGER PRIMARY KEY,
-            workout_id INTEGER,
-            name TEXT,
-            weight TEXT,
-            sets INTEGER,
-            reps INTEGER,
-            FOREIGN KEY (workout_id) REFERENCES workouts (id)
-        )''')
-        db.commit()
+@events.on('workout_completed')
+def update_progress_service(event):
+    # 3. Update Progress Stats (Microservice C)
+    write_to_service('progress', {
+        'user_id': event['user_id'],
+        'workout': {
+            'id': event['workout_id'],
+            'start_time': event['start_time'],
+            'exercises': event['exercises']
+        }
+    })
+
+@events.on('workout_completed')
+def notify_notification_service(event):
+    # 4. Create Notification (Microservice D)
+    write_to_service('notification', {
+        'user_id': event['user_id'],
+        'type': 'workout_complete'
+    })
 
 def save_workout(workout):
+    """Store a finished workout. Returns (workout_id, new personal records)."""
+    user_id = workout.get('user_id', 'default_user')
     with get_db() as db:
         cursor = db.cursor()
         cursor.execute(
-            'INSERT INTO workouts (start_time, end_time, notes) VALUES (?, ?, ?)',
-            (workout['start_time'], workout['end_time'], workout.get('notes', ''))
+            'INSERT INTO workouts (user_id, start_time, end_time, notes, started_at, ended_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, workout['start_time'], workout['end_time'],
+             workout.get('notes', ''), to_iso(workout['start_time']), to_iso(workout['end_time']))
         )
         workout_id = cursor.lastrowid
         
-        for exercise in workout['exercises']:
-            cursor.execute(
-                'INSERT INTO exercises (workout_id, name, weight, sets, reps) VALUES (?, ?, ?, ?, ?)',
-                (workout_id, exercise['name'], exercise['weight'], exercise['sets'], exercise['reps'])
-            )
+        cursor.executemany(
+            'INSERT INTO exercises (workout_id, name, weight, weight_lbs, is_bodyweight, sets, reps) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(workout_id, exercise['name'], exercise['weight'], *parse_weight(exercise['weight']),
+              exercise['sets'], exercise['reps'])
+             for exercise in workout['exercises']]
+        )
+        new_records = update_records(db, user_id, workout_id, to_iso(workout['start_time']),
+                                     workout['exercises'])
+        update_rollups(db, user_id, to_iso(workout['start_time']), workout['exercises'])
+        update_leaderboards(db, user_id, to_iso(workout['start_time']), workout['exercises'])
+        index_workout(db, workout_id, user_id, workout.get('notes', ''),
+                      [exercise['name'] for exercise in workout['exercises']])
         db.commit()
+    history_cache.add_workout(user_id, workout_id, workout)
+    data_version.bump()
+    return workout_id, new_records
+
+def get_workouts(limit=None, since=None, until=None, user_id=None, before_id=None):
+    """Load workouts (newest first) with their exercises.
+
+    since/until filter on the indexed started_at column and take
+    'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM'; since is inclusive, until is
+    exclusive. Exercises for every selected workout are fetched with a
+    single set-based query. Pass user_id to load only that user's history,
+    and before_id (the last id of the previous page) to page through it.
+    """
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append('user_id = ?')
+        params.append(user_id)
+    if before_id is not None:
+        conditions.append('id < ?')
+        params.append(before_id)
+    if since:
+        conditions.append('started_at >= ?')
+        params.append(to_iso(since))
+    if until:
+        conditions.append('started_at < ?')
+        params.append(to_iso(until))
+    query = 'SELECT * FROM workouts'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
 
-def get_workouts():
     with get_db() as db:
         workouts = []
-        for row in db.execute('SELECT * FROM workouts ORDER BY id DESC'):
+        by_id = {}
+        for row in db.execute(query, params):
             workout = dict(row)
             workout['exercises'] = []
-            for ex in db.execute('SELECT * FROM exercises WHERE workout_id = ?', (row['id'],)):
-                workout['exercises'].append(dict(ex))
+            by_id[workout['id']] = workout
             workouts.append(workout)
+        if not workouts:
+            return workouts
+
+        exercise_query = (
+            f'SELECT * FROM exercises WHERE workout_id IN (SELECT id FROM ({query})) '
+            'ORDER BY workout_id, id'
+        )
+        for ex in db.execute(exercise_query, params):
+            by_id[ex['workout_id']]['exercises'].append(dict(ex))
         return workouts
 
-def save_current_workout(workout):
-    with open('current_workout.json', 'w') as f:
-        json.dump(workout, f)
+def current_user_id():
+    return session.get('user_id', 'default_user')
 
-def load_current_workout():
-    try:
-        with open('current_workout.json', 'r') as f:
-            return json.load(f)
-    except:
-        return {'exercises': []}
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            request.endpoint or 'unknown', request.method, response.status_code
+        )
+    return response
+
+def queue_metrics():
+    samples = []
+    for service, entry in message_queue.stats().items():
+        labels = {'service': service}
+        samples.append(('letslift_queue_depth', 'gauge',
+                        'Messages waiting to be processed by a service.', labels, entry['depth']))
+        samples.append(('letslift_queue_oldest_message_age_seconds', 'gauge',
+                        'Age of the oldest unprocessed message.', labels, entry['oldest_age_seconds']))
+        samples.append(('letslift_queue_processed_total', 'counter',
+                        'Messages successfully processed by a service.', labels, entry.get('processed', 0)))
+        samples.append(('letslift_queue_failed_total', 'counter',
+                        'Message deliveries whose handler raised.', labels, entry.get('failed', 0)))
+        samples.append(('letslift_queue_processing_lag_seconds_total', 'counter',
+                        'Sum of publish-to-processed delays.', labels, entry.get('lag_seconds_total', 0)))
+        samples.append(('letslift_queue_last_processing_lag_seconds', 'gauge',
+                        'Publish-to-processed delay of the latest message.', labels, entry.get('last_lag_seconds', 0)))
+    return samples
+
+metrics.register_collector(queue_metrics)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
+@page_cache.cached(current_user_id)
 def home():
     disclaimers = {
         'data_privacy': 'workouts will be stored locally on your device',
@@ -122,7 +247,7 @@ def home():
         'auto_save': 'progress auto-saves every 5 minutes'
     }
     return render_template('home.html', 
-        workout_count=len(get_workouts()),
+        workout_count=history_cache.count(current_user_id()),
         disclaimers=disclaimers)
 
 @app.route('/workout/start', methods=['GET'])
@@ -132,14 +257,7 @@ def start_workout():
     session['workout_timer'] = '00:00:00'
     session['last_set_time'] = None
 
-    current_workout = {
-        'exercises': [],
-        'start_time': datetime.now().strftime("%Y-%m-%d %H:%M"),
-        'notes': '',
-        'step': 1,
-        'total_steps': 3
-    }
-    save_current_workout(current_workout)
+    start_draft(current_user_id(), datetime.now().strftime("%Y-%m-%d %H:%M"))
     return redirect(url_for('add_exercise'))
 
 @app.route('/workout/add-exercise', methods=['GET', 'POST'])
@@ -155,13 +273,17 @@ def add_exercise():
         session['workout_timer'] = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
     if request.method == 'POST':
-        current_workout = load_current_workout()
+        user_id = current_user_id()
+        now_label = datetime.now().strftime("%Y-%m-%d %H:%M")
         
         template_name = request.form.get('template_select')
         if template_name and template_name in WORKOUT_TEMPLATES:
-            current_workout['exercises'].extend(WORKOUT_TEMPLATES[template_name])
+            add_draft_exercises(user_id, WORKOUT_TEMPLATES[template_name], start_time=now_label)
             flash(f'Template "{template_name}" loaded!')
-            save_current_workout(current_workout)
+            return redirect(url_for('add_exercise'))
+
+        if is_bad_weight(request.form.get('weight')):
+            flash('Weight must be a finite number or Bodyweight.')
             return redirect(url_for('add_exercise'))
 
         if session.get('last_set_time'):
@@ -172,35 +294,40 @@ def add_exercise():
                 flash(f'Warning: Only {rest_time} seconds rest. Recommended: 90 seconds')
 
         exercise = {
-            'name': request.form.get('exercise_name', 'Custom Exercise'),
+            # One spelling per exercise, so stats don't split on case or spacing
+            'name': exercise_names.canonical_name(request.form.get('exercise_name') or 'Custom Exercise'),
             'weight': request.form.get('weight', 'Bodyweight'),
             'sets': int(request.form.get('sets', 3)),
             'reps': int(request.form.get('reps', 10))
         }
         session['last_set_time'] = datetime.now().strftime("%H:%M:%S")
-        current_workout['exercises'].append(exercise)
-        save_current_workout(current_workout)
+        add_draft_exercises(user_id, [exercise], start_time=now_label)
         flash('Exercise added! Add another or finish when ready.')
         return redirect(url_for('add_exercise'))
 
     return render_template('add_exercise.html',
-        current_exercises=load_current_workout().get('exercises', []),
+        current_exercises=load_draft(current_user_id())['exercises'],
         workout_templates=WORKOUT_TEMPLATES,
         workout_start=session.get('workout_start_time'),
         last_set=session.get('last_set_time'))
 
+@app.route('/exercises/autocomplete')
+def autocomplete_exercise():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', exercise_names.MAX_SUGGESTIONS, type=int), 50))
+    return {'query': query, 'suggestions': exercise_names.suggest(query, limit)}
+
 @app.route('/workout/undo-last', methods=['POST'])
 def undo_last_exercise():
-    current_workout = load_current_workout()
-    if current_workout.get('exercises'):
-        removed = current_workout['exercises'].pop()
-        save_current_workout(current_workout)
+    removed = pop_draft_exercise(current_user_id())
+    if removed:
         flash(f'removed {removed["name"]}. try again or continue.')
     return redirect(url_for('add_exercise'))
 
 @app.route('/workout/finish', methods=['POST'])
 def finish_workout():
-    current_workout = load_current_workout()
+    user_id = current_user_id()
+    current_workout = load_draft(user_id)
     if not current_workout.get('exercises'):
         flash('Add at least one exercise to save your workout!')
         return redirect(url_for('add_exercise'))
@@ -220,86 +347,229 @@ def finish_workout():
         current_workout['end_time'] = datetime.now().strftime("%Y-%m-%d %H:%M")
     
     current_workout['notes'] = request.form.get('workout_notes', '')
-    save_workout(current_workout)
-    
-    user_id = session.get('user_id', 'default_user')
-    
-    # 1. Update Streak (Microservice A)
-    streak_date = workout_datetime.strftime("%m-%d-%Y") if workout_date else datetime.now().strftime("%m-%d-%Y")
-    with open('data/workout_date.txt', 'w') as f:
-        f.write(streak_date)
-    print(f"Streak Service: Workout date recorded: {streak_date}")
+    current_workout['user_id'] = user_id
+    workout_id, new_records = save_workout(current_workout)
     
-    # 2. Create Social Post (Microservice B)
-    exercises_summary = ", ".join([ex['name'] for ex in current_workout['exercises']])
-    write_to_service('social', {
+    # Streak, social, progress and notification updates run in the background;
+    # the streak counts the day the workout is stored under
+    streak_date = datetime.strptime(current_workout['start_time'][:10], '%Y-%m-%d').strftime("%m-%d-%Y")
+    events.dispatch('workout_completed', {
+        'workout_id': workout_id,
         'user_id': user_id,
-        'content': f'Completed a workout! 💪 Exercises: {exercises_summary}'
+        'date': streak_date,
+        'start_time': current_workout['start_time'],
+        'exercises': current_workout['exercises']
     })
     
-    # 3. Update Progress Stats (Microservice C)
-    write_to_service('progress', {
-        'workouts': get_workouts(),
-        'current_workout': current_workout
-    })
-    
-    # 4. Create Notification (Microservice D)
-    write_to_service('notification', {
-        'user_id': user_id,
-        'type': 'workout_complete'
-    })
-    
-    if os.path.exists('current_workout.json'):
-        os.remove('current_workout.json')
+    discard_draft(user_id)
     session.pop('workout_in_progress', None)
     
     flash('Great job! Workout saved. 💪')
+    # First-time exercises set every record trivially; only flag improvements
+    for record in new_records:
+        if record['previous'] is not None:
+            flash(f"New PR! {record['exercise']} - {record['label']}: "
+                  f"{record['value']:g} lbs (was {record['previous']:g})")
     return redirect(url_for('view_history'))
 
+def get_history_page(user_id, before_id=None, page_size=HISTORY_PAGE_SIZE):
+    """One page of a user's history and the cursor for the next (older) page.
+
+    Keyset pagination on the workout id, so every page costs the same no
+    matter how far back it is. The newest page comes from history_cache.
+    """
+    if before_id is None and page_size < history_cache.RECENT_WORKOUTS:
+        workouts = history_cache.recent(user_id, page_size + 1)
+    else:
+        workouts = get_workouts(limit=page_size + 1, user_id=user_id, before_id=before_id)
+    next_before = None
+    if len(workouts) > page_size:
+        workouts = workouts[:page_size]
+        next_before = workouts[-1]['id']
+    return workouts, next_before
+
+def history_cursor():
+    try:
+        return int(request.args['before'])
+    except (KeyError, ValueError):
+        return None
+
 @app.route('/history')
+@page_cache.cached(current_user_id)
 def view_history():
-    workouts = get_workouts()
-    
-    # Send all workouts to progress service
-    write_to_service('progress', {
-        'workouts': workouts,
-        'current_workout': None
-    })
+    user_id = current_user_id()
+    before_id = history_cursor()
+    workouts, next_before = get_history_page(user_id, before_id)
     
-    # Get progress stats and debug print
-    progress_stats = read_from_service('progress') or {}
-    print("DEBUG - Progress Stats:", json.dumps(progress_stats, indent=2))
+    # Get the user's progress stats (kept up to date by the progress service)
+    progress_stats = get_progress_stats(user_id)
+    logger.debug("Progress stats: %s", progress_stats)
     
     # Get streak from Microservice A
-    current_streak = 0
-    try:
-        with open('data/streak.txt', 'r') as f:
-            current_streak = int(f.read().strip())
-    except (FileNotFoundError, ValueError):
-        pass
+    streak = get_streak(user_id)
     
-    # Get social posts from Microservice B
-    social_posts = []
-    try:
-        with open('data/social_posts.json', 'r') as f:
-            social_posts = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
+    # Get the user's timeline (own and followed posts) from Microservice B
+    social_posts = get_timeline(user_id, limit=TIMELINE_SHOWN)
     
-    # Get notifications from Microservice D
-    notifications = []
-    try:
-        with open('data/notifications.json', 'r') as f:
-            notifications = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
+    # Get the user's newest notifications from Microservice D
+    notifications = get_recent_notifications(user_id, limit=NOTIFICATIONS_SHOWN)
+
+    # The session cookie is sent before the body streams, so flashed
+    # messages have to be consumed now rather than while rendering
+    get_flashed_messages()
         
-    return render_template('history.html', 
+    return stream_template('history.html', 
         workouts=workouts,
-        current_streak=current_streak,
+        next_before=next_before,
+        first_page=before_id is None,
+        workout_count=history_cache.count(user_id),
+        current_streak=streak['current'],
+        longest_streak=streak['longest'],
         progress_stats=progress_stats,
+        personal_records=get_records(user_id),
+        heatmap=get_heatmap(user_id),
+        leaderboard=get_leaderboard('volume', 'week', limit=LEADERBOARD_SHOWN, user_id=user_id),
+        # Trends scan the whole history, so they are computed while the
+        # top of the page is already on its way
+        load_trends=partial(get_trends, user_id),
         social_posts=social_posts,
-        notifications=notifications)
+        following=get_following(user_id),
+        notifications=notifications,
+        unread_notifications=get_unread_count(user_id))
+
+@app.route('/history/page')
+@page_cache.cached(current_user_id)
+def history_page():
+    """Older workouts as an HTML fragment, fetched by the "Load older" button."""
+    workouts, next_before = get_history_page(current_user_id(), history_cursor())
+    return render_template('_workout_page.html', workouts=workouts, next_before=next_before)
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+@app.route('/stats/range')
+def stats_range():
+    """Training totals for ?start=YYYY-MM-DD&end=YYYY-MM-DD, by day or by ?granularity=week."""
+    granularity = request.args.get('granularity', 'day')
+    try:
+        if granularity not in ('day', 'week'):
+            raise ValueError('granularity must be day or week')
+        start = parse_day(request.args['start'])
+        end = parse_day(request.args.get('end') or datetime.now().strftime('%Y-%m-%d'))
+        return get_range(current_user_id(), start, end, granularity)
+    except KeyError:
+        return {'error': 'start is required'}, 400
+    except (ValueError, OverflowError) as e:
+        # OverflowError: ranges ending in the last days of year 9999
+        return {'error': str(e)}, 400
+
+@app.route('/stats/heatmap')
+def stats_heatmap():
+    """Calendar heatmap cells for ?year=YYYY, or for the last 365 days."""
+    year = request.args.get('year', type=int)
+    if year is None:
+        return {'cells': get_heatmap(current_user_id())}
+    if not MINYEAR <= year <= MAXYEAR:
+        return {'error': f'year must be between {MINYEAR} and {MAXYEAR}'}, 400
+    end = datetime(year, 12, 31).date()
+    return {'year': year, 'cells': get_heatmap(current_user_id(), end=end, days=end.timetuple().tm_yday)}
+
+@app.route('/leaderboard')
+def leaderboard():
+    """Top users and your rank: ?board=volume|workouts|streak&period=week|month&key=2024-W05|2024-02."""
+    try:
+        return get_leaderboard(
+            request.args.get('board', 'volume'), request.args.get('period', 'week'),
+            key=request.args.get('key'), limit=request.args.get('limit', TOP_K, type=int),
+            user_id=current_user_id())
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+@app.route('/search')
+def search():
+    """Your workouts matching ?q=, ranked, with &page= and &page_size=."""
+    return search_workouts(current_user_id(), request.args.get('q', ''),
+                           page=request.args.get('page', 1, type=int),
+                           page_size=request.args.get('page_size', SEARCH_PAGE_SIZE, type=int))
+
+@app.route('/timeline')
+def timeline():
+    """A page of the user's social timeline as JSON; ?before=<id> for older posts."""
+    limit = max(1, min(request.args.get('limit', FEED_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    posts = get_timeline(current_user_id(), limit=limit, before_id=request.args.get('before', type=int))
+    return {
+        'posts': posts,
+        'next_before': posts[-1]['id'] if len(posts) == limit else None
+    }
+
+@app.route('/follow', methods=['POST'])
+def follow_user():
+    followee_id = request.form.get('user_id', '').strip()
+    if followee_id and follow(current_user_id(), followee_id):
+        flash(f'Now following {followee_id}.')
+    return redirect(url_for('view_history'))
+
+@app.route('/unfollow', methods=['POST'])
+def unfollow_user():
+    followee_id = request.form.get('user_id', '').strip()
+    if followee_id and unfollow(current_user_id(), followee_id):
+        flash(f'Unfollowed {followee_id}.')
+    return redirect(url_for('view_history'))
+
+@app.route('/notifications')
+def list_notifications():
+    """A page of the user's inbox as JSON; ?before=<id> for older, ?unread=1 for unread only."""
+    user_id = current_user_id()
+    limit = max(1, min(request.args.get('limit', FEED_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    notifications = get_recent_notifications(
+        user_id, limit=limit, before_id=request.args.get('before', type=int),
+        unread_only=request.args.get('unread') == '1')
+    return {
+        'unread': get_unread_count(user_id),
+        'notifications': notifications,
+        'next_before': notifications[-1]['id'] if len(notifications) == limit else None
+    }
+
+@app.route('/notifications/<int:notification_id>/read', methods=['POST'])
+def read_notification(notification_id):
+    mark_read(current_user_id(), [notification_id])
+    return redirect(url_for('view_history'))
+
+@app.route('/notifications/read-all', methods=['POST'])
+def read_all_notifications():
+    mark_all_read(current_user_id())
+    return redirect(url_for('view_history'))
+
+@app.route('/history/export')
+def export_history():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in history_io.FORMATS:
+        return Response(f'Unknown format: {fmt}', status=400, mimetype='text/plain')
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    # Streamed straight from the cursor, so the history is never loaded whole
+    return Response(
+        stream_with_context(history_io.export_history(current_user_id(), fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=letslift-history.{fmt}'})
+
+@app.route('/history/import', methods=['POST'])
+def import_history():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or JSONL file to import.')
+        return redirect(url_for('view_history'))
+
+    fmt = request.form.get('format') or history_io.detect_format(upload.filename)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    try:
+        workouts, exercises = history_io.import_workouts(
+            history_io.iter_workouts(stream, fmt), current_user_id())
+    except (history_io.HistoryFormatError, UnicodeDecodeError) as e:
+        logger.warning("Rejected history import: %s", e)
+        flash(f'Import failed, nothing was saved: {e}')
+    else:
+        flash(f'Imported {workouts} workouts ({exercises} exercises).')
+    return redirect(url_for('view_history'))
 
 if __name__ == '__main__':
     os.makedirs('data', exist_ok=True)
@@ -0,0 +1,167 @@
+"""Deterministic synthetic workout history for benchmarks.
+
+Builds a workouts.db and the data/ stores (feeds, queue) inside a
+scratch directory and points the app and service modules at it, so the
+benchmarks never touch your real data.
+
+    python -m benchmarks.generate /tmp/letslift-bench --exercises 100000
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+import data_version
+import db
+from leaderboards import rebuild_leaderboards
+from records import rebuild_records
+from rollups import rebuild_rollups
+from search import rebuild_search
+from services import feed_store, message_queue, progress
+from services.streak import rebuild_streaks
+
+EXERCISE_NAMES = [
+    'Bench Press', 'Squats', 'Deadlift', 'Overhead Press', 'Barbell Rows',
+    'Pull Ups', 'Push Ups', 'Dumbbell Rows', 'Lunges', 'Calf Raises',
+    'Incline Bench Press', 'Romanian Deadlift', 'Leg Press', 'Lat Pulldown',
+    'Bicep Curls', 'Tricep Extensions', 'Face Pulls', 'Hip Thrusts',
+    'Dips', 'Plank'
+]
+BODYWEIGHT_EXERCISES = {'Pull Ups', 'Push Ups', 'Lunges', 'Dips', 'Plank'}
+
+EXERCISES_PER_WORKOUT = (3, 8)
+HISTORY_DAYS = 5 * 365
+CHUNK_SIZE = 10000
+FOLLOWS_PER_USER = 10
+
+def use_workspace(path):
+    """Point db, feed_store, message_queue, progress and the data version at a scratch directory."""
+    path = os.path.abspath(path)
+    data_dir = os.path.join(path, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    os.chdir(path)
+    db.close_db()
+    db.DB_PATH = os.path.join(path, 'workouts.db')
+    feed_store.FEEDS_DB = os.path.join(data_dir, 'feeds.db')
+    feed_store.ARCHIVE_DIR = os.path.join(data_dir, 'archive')
+    message_queue.QUEUE_DB = os.path.join(data_dir, 'queue.db')
+    progress.DATA_DIR = data_dir
+    progress.DB_PATH = db.DB_PATH
+    data_version.VERSION_FILE = os.path.join(data_dir, 'data_version')
+    return path
+
+def random_exercise(rng):
+    name = rng.choice(EXERCISE_NAMES)
+    if name in BODYWEIGHT_EXERCISES and rng.random() < 0.5:
+        weight = 'Bodyweight'
+    else:
+        weight = str(rng.randrange(5, 400, 5))
+    return name, weight, rng.randint(1, 5), rng.randint(1, 15)
+
+def generate_workouts(n_exercises, seed=0, end=None):
+    """Yield (start_time, exercises) tuples totalling n_exercises exercises."""
+    rng = random.Random(seed)
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    low, high = EXERCISES_PER_WORKOUT
+    n_workouts = max(1, n_exercises * 2 // (low + high))
+    step = timedelta(days=HISTORY_DAYS) / n_workouts
+    start = end - timedelta(days=HISTORY_DAYS)
+
+    remaining = n_exercises
+    for i in range(n_workouts):
+        if remaining <= 0:
+            break
+        count = remaining if i == n_workouts - 1 else min(remaining, rng.randint(low, high))
+        remaining -= count
+        start_time = (start + step * i).strftime("%Y-%m-%d %H:%M")
+        yield start_time, [random_exercise(rng) for _ in range(count)]
+
+def populate_db(n_exercises, seed=0):
+    """Fill workouts.db with a synthetic history and its derived tables. Returns the workout count."""
+    conn = db.connect(db.DB_PATH)
+    try:
+        db.migrate(conn)
+        workout_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM workouts').fetchone()[0]
+        workout_rows = []
+        exercise_rows = []
+
+        def flush():
+            conn.executemany(
+                'INSERT INTO workouts (id, start_time, end_time, notes, started_at, ended_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)', workout_rows)
+            conn.executemany(
+                'INSERT INTO exercises (workout_id, name, weight, weight_lbs, is_bodyweight, sets, reps) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', exercise_rows)
+            workout_rows.clear()
+            exercise_rows.clear()
+
+        count = 0
+        for start_time, exercises in generate_workouts(n_exercises, seed):
+            workout_id += 1
+            count += 1
+            iso = db.to_iso(start_time)
+            workout_rows.append((workout_id, start_time, start_time, '', iso, iso))
+            for name, weight, sets, reps in exercises:
+                exercise_rows.append((workout_id, name, weight, *db.parse_weight(weight), sets, reps))
+            if len(exercise_rows) >= CHUNK_SIZE:
+                flush()
+        flush()
+        conn.commit()
+    finally:
+        conn.close()
+    rebuild_derived()
+    return count
+
+def rebuild_derived():
+    """Recompute what save_workout() keeps current, since populate_db() inserts rows directly."""
+    rebuild_records()
+    rebuild_rollups()
+    rebuild_leaderboards()
+    rebuild_streaks()
+    rebuild_search()
+    progress.rebuild_all()
+
+def populate_feeds(n_entries, seed=0):
+    """Append n_entries synthetic social posts and notifications, and a follow graph."""
+    rng = random.Random(seed)
+    conn = feed_store.connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO social_posts (user_id, content, timestamp) VALUES (?, ?, ?)',
+            [(f'user_{rng.randrange(100)}',
+              f'Completed a workout! 💪 Exercises: {", ".join(rng.sample(EXERCISE_NAMES, 3))}',
+              '2025-01-01 12:00')
+             for _ in range(n_entries)]
+        )
+        # Inserted directly rather than fanned out, so they are read from their authors
+        conn.execute('INSERT OR IGNORE INTO pulled_authors (user_id) '
+                     'SELECT DISTINCT user_id FROM social_posts WHERE fanned_out = 0')
+        conn.executemany(
+            'INSERT INTO notifications (user_id, message, timestamp) VALUES (?, ?, ?)',
+            [(f'user_{rng.randrange(100)}', 'Workout completed! 💪', '2025-01-01 12:00')
+             for _ in range(n_entries)]
+        )
+        conn.executemany(
+            'INSERT OR IGNORE INTO follows (follower_id, followee_id) VALUES (?, ?)',
+            [(f'user_{follower}', f'user_{followee}')
+             for follower in range(100)
+             for followee in rng.sample(range(100), FOLLOWS_PER_USER)
+             if followee != follower]
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic LetsLift workspace')
+    parser.add_argument('workspace', help='directory to create workouts.db and data/ in')
+    parser.add_argument('--exercises', type=int, default=10000)
+    parser.add_argument('--feed-entries', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    use_workspace(args.workspace)
+    workouts = populate_db(args.exercises, args.seed)
+    populate_feeds(args.feed_entries, args.seed)
+    print(f"Generated {workouts} workouts / {args.exercises} exercises and "
+          f"{args.feed_entries} feed entries in {os.getcwd()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""gunicorn settings for benchmarks.load --workers.
+
+The production settings from gunicorn.conf.py, serving the scratch
+workspace named by LETSLIFT_WORKSPACE instead of the real data.
+"""
+import os
+import runpy
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_production = runpy.run_path(os.path.join(APP_DIR, 'gunicorn.conf.py'))
+globals().update((name, value) for name, value in _production.items() if not name.startswith('__'))
+
+def on_starting(server):
+    """Switch to the workspace, then migrate it; workers inherit it through the fork."""
+    from benchmarks import generate
+    generate.use_workspace(os.environ['LETSLIFT_WORKSPACE'])
+    _production['on_starting'](server)
@@ -0,0 +1,488 @@
+"""Concurrent load test: many simulated lifters using the app at once.
+
+Each simulated user loops start -> add exercises -> finish -> history
+with random think times in between, while the streak, social, progress
+and notification services run as separate local processes consuming the
+queue. At the end it reports throughput and p50/p95/p99 latency per route
+and, per service, how long finished workouts waited to be processed.
+
+    python -m benchmarks.load --users 100 --duration 60 --think 1.0
+    python -m benchmarks.load --mode server          # real HTTP via a local WSGI server
+    python -m benchmarks.load --workers 4 --verify   # gunicorn with 4 worker processes
+    python -m benchmarks.load --url http://127.0.0.1:8000 --workspace /srv/letslift
+
+By default a fresh synthetic workspace is generated (see benchmarks.generate).
+With --url an already running deployment is driven instead; its services
+are not started here, its queue is read from --workspace, and
+LETSLIFT_SECRET_KEY must match its session secret. --verify
+checks afterwards that no update was lost: every finished workout is
+stored once and counted in the rollups, records, leaderboards, streaks,
+feeds and progress stats.
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks import generate
+from services import feed_store, message_queue, progress
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(APP_DIR, 'benchmarks', 'gunicorn.conf.py')
+
+# Service module -> entry point, as started by `python -m services.<module>`
+SERVICES = {
+    'streak': 'run_streak_service',
+    'social': 'run_social_service',
+    'progress': 'run_progress_service',
+    'notifications': 'run_notification_service',
+}
+EXERCISES_PER_WORKOUT = (3, 6)
+SAMPLE_INTERVAL = 0.5       # seconds between queue backlog samples
+DRAIN_TIMEOUT = 60          # max seconds to wait for the services to catch up
+STARTUP_TIMEOUT = 30        # max seconds to wait for gunicorn to accept connections
+LOAD_USER_PREFIX = 'load_user_'
+
+def run_service(workspace, module):
+    """Entry point of a service process started by start_services()."""
+    # Import first: use_workspace() changes directory, and then repoints the modules
+    service = __import__(f'services.{module}', fromlist=[module])
+    generate.use_workspace(workspace)
+    getattr(service, SERVICES[module])()
+
+def start_services(workspace, log_path):
+    log = open(log_path, 'ab')
+    processes = []
+    for module in SERVICES:
+        code = f'from benchmarks.load import run_service; run_service({workspace!r}, {module!r})'
+        processes.append(subprocess.Popen([sys.executable, '-c', code], cwd=APP_DIR,
+                                          stdout=log, stderr=subprocess.STDOUT))
+    log.close()
+    return processes
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def start_gunicorn(workspace, workers, log_path):
+    """Serve the app from workspace with the production settings. Returns (process, url)."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, LETSLIFT_WORKSPACE=workspace)
+    with open(log_path, 'ab') as log:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG,
+             '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app:app'],
+            cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}, see {log_path}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn did not start within {STARTUP_TIMEOUT}s, see {log_path}')
+
+def session_cookie(flask_app, user_id):
+    """A signed Flask session cookie logging a client in as user_id."""
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return flask_app.config['SESSION_COOKIE_NAME'], serializer.dumps({'user_id': user_id})
+
+class TestClientUser:
+    """Talks to the app in-process through Flask's test client."""
+
+    def __init__(self, flask_app, user_id):
+        self.client = flask_app.test_client()
+        self.client.set_cookie(*session_cookie(flask_app, user_id))
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class HttpUser:
+    """Talks to a server over HTTP/1.1 keep-alive, keeping its own cookies."""
+
+    def __init__(self, url, cookie):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.cookies = {cookie[0]: cookie[1]}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': '; '.join(f'{k}={v}' for k, v in self.cookies.items())}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; retry once on a new one
+                self.close()
+                if attempt:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}     # route -> [seconds, ...]
+        self.errors = {}        # route -> count
+        self.workouts = 0
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+def simulate_user(user, results, stop_at, think, seed):
+    rng = random.Random(seed)
+
+    def think_time():
+        if think > 0:
+            time.sleep(min(rng.expovariate(1 / think), think * 5))
+
+    def call(route, method, path, form=None):
+        started = time.perf_counter()
+        try:
+            status = user.request(method, path, form)
+        except Exception:
+            status = None
+        results.record(route, time.perf_counter() - started, status is not None and status < 400)
+        return status
+
+    try:
+        while time.time() < stop_at:
+            call('GET /workout/start', 'GET', '/workout/start')
+            call('GET /workout/add-exercise', 'GET', '/workout/add-exercise')
+            for _ in range(rng.randint(*EXERCISES_PER_WORKOUT)):
+                think_time()
+                name, weight, sets, reps = generate.random_exercise(rng)
+                call('POST /workout/add-exercise', 'POST', '/workout/add-exercise',
+                     {'exercise_name': name, 'weight': weight, 'sets': sets, 'reps': reps})
+            think_time()
+            if call('POST /workout/finish', 'POST', '/workout/finish', {'workout_notes': ''}) == 302:
+                with results.lock:
+                    results.workouts += 1
+            call('GET /history', 'GET', '/history')
+            think_time()
+    finally:
+        user.close()
+
+def sample_queues(stop, backlog):
+    """Track the oldest pending message age per service until stop is set."""
+    while not stop.wait(SAMPLE_INTERVAL):
+        try:
+            for service, entry in message_queue.stats().items():
+                backlog[service] = max(backlog.get(service, 0.0), entry['oldest_age_seconds'])
+        except Exception:
+            # The queue is busy; the next sample will do
+            pass
+
+def wait_for_services(timeout):
+    """Seconds until every queue is empty, or None if it never empties."""
+    started = time.time()
+    while time.time() - started < timeout:
+        if all(entry['depth'] == 0 for entry in message_queue.stats().values()):
+            return time.time() - started
+        time.sleep(SAMPLE_INTERVAL)
+    return None
+
+def run_load(args):
+    if args.url is None:
+        # Shared with gunicorn through the environment so both sign the same cookies
+        os.environ.setdefault('LETSLIFT_SECRET_KEY', secrets.token_hex(32))
+    elif not os.environ.get('LETSLIFT_SECRET_KEY'):
+        raise SystemExit("--url needs LETSLIFT_SECRET_KEY set to the deployment's session secret")
+    os.makedirs(os.path.join(args.workspace, 'data'), exist_ok=True)
+    generate.use_workspace(args.workspace)
+    processes = []
+    server = None
+    url = args.url
+    if url is None:
+        if args.exercises:
+            generate.populate_db(args.exercises, args.seed)
+            generate.populate_feeds(args.feed_entries, args.seed)
+        import app
+        app.init_db()
+        app.app.debug = False
+        if not args.no_services:
+            processes = start_services(args.workspace, os.path.join(args.workspace, 'services.log'))
+
+    from app import app as flask_app
+    if url is None and args.workers:
+        gunicorn, url = start_gunicorn(args.workspace, args.workers,
+                                       os.path.join(args.workspace, 'gunicorn.log'))
+        processes.append(gunicorn)
+    elif url is None and args.mode == 'server':
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}'
+
+    def new_user(i):
+        user_id = f'{LOAD_USER_PREFIX}{i}'
+        if url is None:
+            return TestClientUser(flask_app, user_id)
+        return HttpUser(url, session_cookie(flask_app, user_id))
+
+    queue_before = message_queue.stats()
+    saved_before = saved_counts()
+    backlog = {}
+    stop_sampling = threading.Event()
+    sampler = threading.Thread(target=sample_queues, args=(stop_sampling, backlog), daemon=True)
+    results = Results()
+    try:
+        sampler.start()
+        started = time.time()
+        stop_at = started + args.duration
+        threads = [threading.Thread(target=simulate_user,
+                                    args=(new_user(i), results, stop_at, args.think, args.seed + i))
+                   for i in range(args.users)]
+        for thread in threads:
+            thread.start()
+            # Ramp up over the first think time rather than all at once
+            time.sleep(args.think / args.users if args.think else 0)
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+        if args.url is None and not args.workers:
+            import events
+            events.drain()
+        else:
+            # The server's workers publish from their own event threads
+            time.sleep(SAMPLE_INTERVAL * 2)
+        drain_seconds = wait_for_services(DRAIN_TIMEOUT) if processes or args.url else None
+        stop_sampling.set()
+        sampler.join()
+        queue_after = message_queue.stats()
+        problems = verify(results, saved_before) if args.verify else None
+    finally:
+        stop_sampling.set()
+        if server is not None:
+            server.shutdown()
+        stop_services(processes)
+    result = report(results, elapsed, queue_before, queue_after, backlog, drain_seconds)
+    result['problems'] = problems
+    return result
+
+def saved_counts():
+    """Workouts, social posts and notifications stored so far for the simulated users."""
+    from db import get_db
+    pattern = LOAD_USER_PREFIX + '%'
+    with get_db() as db:
+        workouts = db.execute('SELECT COUNT(*) FROM workouts WHERE user_id LIKE ?', (pattern,)).fetchone()[0]
+    feeds = feed_store.connection()
+    posts = feeds.execute('SELECT COUNT(*) FROM social_posts WHERE user_id LIKE ?', (pattern,)).fetchone()[0]
+    notifications = feeds.execute(
+        'SELECT COUNT(*) FROM notifications WHERE user_id LIKE ?', (pattern,)).fetchone()[0]
+    return {'workouts': workouts, 'social_posts': posts, 'notifications': notifications}
+
+def verify(results, saved_before):
+    """Check that every finished workout was stored and counted exactly once.
+
+    Returns a list of problems, empty if everything adds up.
+    """
+    from db import get_db
+    problems = []
+    errors = sum(results.errors.values())
+    if errors:
+        problems.append(f'{errors} requests failed')
+
+    saved_after = saved_counts()
+    for name in ('workouts', 'social_posts', 'notifications'):
+        added = saved_after[name] - saved_before[name]
+        if added != results.workouts:
+            problems.append(f'{results.workouts} workouts finished but {added} {name} were added')
+
+    pattern = LOAD_USER_PREFIX + '%'
+    with get_db() as db:
+        checks = {
+            'daily rollups': (
+                'SELECT w.user_id, substr(w.started_at, 1, 10), COUNT(*) FROM workouts w '
+                'WHERE w.user_id LIKE ? GROUP BY 1, 2',
+                'SELECT user_id, day, workouts FROM daily_rollups WHERE user_id LIKE ?'),
+            'personal records': (
+                'SELECT w.user_id, e.name, MAX(e.weight_lbs) FROM exercises e '
+                'JOIN workouts w ON w.id = e.workout_id '
+                'WHERE w.user_id LIKE ? AND e.is_bodyweight = 0 AND e.weight_lbs > 0 AND e.reps > 0 '
+                'GROUP BY 1, 2',
+                "SELECT user_id, exercise, value FROM personal_records WHERE user_id LIKE ? AND metric = 'weight'"),
+            'monthly leaderboards': (
+                'SELECT user_id, substr(started_at, 1, 7), COUNT(*) FROM workouts '
+                'WHERE user_id LIKE ? GROUP BY 1, 2',
+                "SELECT user_id, period, CAST(score AS INTEGER) FROM leaderboard_scores "
+                "WHERE user_id LIKE ? AND board = 'workouts' AND length(period) = 7 AND score > 0"),
+            'streak days': (
+                'SELECT DISTINCT user_id FROM workouts WHERE user_id LIKE ?',
+                'SELECT DISTINCT user_id FROM workout_days WHERE user_id LIKE ?'),
+        }
+        for name, (expected_sql, actual_sql) in checks.items():
+            expected = set(map(tuple, db.execute(expected_sql, (pattern,))))
+            actual = set(map(tuple, db.execute(actual_sql, (pattern,))))
+            if expected != actual:
+                problems.append(f'{name}: {len(expected ^ actual)} rows differ from the workout history')
+        user_workouts = db.execute(
+            'SELECT user_id, COUNT(*) FROM workouts WHERE user_id LIKE ? GROUP BY 1', (pattern,)
+        ).fetchall()
+
+    wrong = [user_id for user_id, count in user_workouts
+             if progress.get_stats(user_id).get('total_workouts') != count]
+    if wrong:
+        problems.append(f'progress stats: {len(wrong)} users have the wrong workout count')
+    return problems
+
+def report(results, elapsed, queue_before, queue_after, backlog, drain_seconds):
+    routes = {}
+    total = 0
+    for route, latencies in sorted(results.latencies.items()):
+        latencies.sort()
+        total += len(latencies)
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': results.errors.get(route, 0),
+            'per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+        }
+    services = {}
+    for service, after in sorted(queue_after.items()):
+        before = queue_before.get(service, {})
+        processed = after.get('processed', 0) - before.get('processed', 0)
+        lag_total = after.get('lag_seconds_total', 0) - before.get('lag_seconds_total', 0)
+        services[service] = {
+            'processed': processed,
+            'failed': after.get('failed', 0) - before.get('failed', 0),
+            'mean_lag_ms': lag_total / processed * 1000 if processed else 0.0,
+            'max_backlog_age_ms': backlog.get(service, 0.0) * 1000,
+            'pending': after['depth'],
+        }
+    return {
+        'elapsed_seconds': elapsed,
+        'requests': total,
+        'requests_per_second': total / elapsed,
+        'workouts_per_second': results.workouts / elapsed,
+        'routes': routes,
+        'services': services,
+        'drain_seconds': drain_seconds,
+    }
+
+def print_report(result):
+    print(f"\n{result['requests']} requests in {result['elapsed_seconds']:.1f}s: "
+          f"{result['requests_per_second']:.1f} req/s, {result['workouts_per_second']:.2f} workouts/s")
+    print(f"\n{'route':<30} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, entry in result['routes'].items():
+        print(f"{route:<30} {entry['requests']:>9} {entry['errors']:>7} {entry['per_second']:>8.1f} "
+              f"{entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} {entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}")
+    if result['services']:
+        print(f"\n{'service':<14} {'processed':>9} {'failed':>7} {'mean lag ms':>12} "
+              f"{'max backlog ms':>15} {'pending':>8}")
+        for service, entry in result['services'].items():
+            print(f"{service:<14} {entry['processed']:>9} {entry['failed']:>7} {entry['mean_lag_ms']:>12.1f} "
+                  f"{entry['max_backlog_age_ms']:>15.1f} {entry['pending']:>8}")
+    if result['drain_seconds'] is not None:
+        print(f"\nServices caught up {result['drain_seconds']:.1f}s after the load stopped")
+    if result['problems'] is not None:
+        print('\nVerification: ' + ('OK' if not result['problems'] else 'FAILED'))
+        for problem in result['problems']:
+            print(f'  - {problem}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test LetsLift with concurrent simulated users')
+    parser.add_argument('--users', type=int, default=50, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to generate load for')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='mean think time between a user\'s actions, in seconds')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client',
+                        help='Flask test client in-process, or HTTP through a local threaded WSGI server')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='serve the app with gunicorn and this many worker processes')
+    parser.add_argument('--url', help='drive an already running server instead (its services are not started)')
+    parser.add_argument('--workspace', help='use this workspace instead of a fresh synthetic one')
+    parser.add_argument('--exercises', type=int, default=10000,
+                        help='synthetic history to generate in a fresh workspace')
+    parser.add_argument('--feed-entries', type=int, default=10000)
+    parser.add_argument('--no-services', action='store_true', help='don\'t start the service processes')
+    parser.add_argument('--verify', action='store_true',
+                        help='check afterwards that every finished workout was counted exactly once')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.workspace is None:
+            if args.url is not None:
+                args.workspace = APP_DIR
+            else:
+                args.workspace = stack.enter_context(tempfile.TemporaryDirectory(prefix='letslift-load-'))
+        elif args.url is None:
+            # Existing workspace: keep its data as it is
+            args.exercises = 0
+        args.workspace = os.path.abspath(args.workspace)
+        # The app logs a line per saved workout; keep the report readable
+        logging.disable(logging.INFO)
+        result = run_load(args)
+        print_report(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if result['problems']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Repeatable benchmarks for the history, progress and feed hot paths.
+
+For each requested size a fresh synthetic workspace is generated (see
+benchmarks.generate) and every benchmark reports its median wall time and
+peak traced memory:
+
+    python -m benchmarks.run --sizes 10000 100000 1000000 --json results.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import generate
+
+def measure(func, repeat):
+    """Median seconds over repeat runs, plus peak memory of one traced run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+def benchmarks(app):
+    """Name -> zero-argument callable for each hot path."""
+    import page_cache
+    import search
+    from services import notifications, progress, social
+
+    client = app.app.test_client()
+    new_workout = {
+        'workout': {
+            'id': None,
+            'start_time': time.strftime("%Y-%m-%d %H:%M"),
+            'exercises': [{'name': 'Bench Press', 'weight': '135', 'sets': 3, 'reps': 10}]
+        }
+    }
+
+    def history_route():
+        # Measure rendering, not the rendered-page cache
+        page_cache.clear()
+        response = client.get('/history')
+        # The page is streamed; read it all so rendering is included
+        assert response.status_code == 200 and response.data
+
+    return {
+        'get_workouts (all)': lambda: app.get_workouts(),
+        'get_workouts (limit=20)': lambda: app.get_workouts(limit=20),
+        'progress.rebuild_state': lambda: progress.rebuild_state(),
+        'progress.calculate_stats (1 workout)': lambda: progress.calculate_stats(new_workout),
+        'social.process_social_post': lambda: social.process_social_post({'content': 'bench'}),
+        'notifications.create_notification': lambda: notifications.create_notification({}),
+        'social.get_recent_posts': lambda: social.get_recent_posts(),
+        # An older page, which always bypasses the in-memory timeline cache
+        'social.get_timeline (user_0)': lambda: social.get_timeline('user_0', before_id=2 ** 62),
+        'search.search_workouts (bench press)': lambda: search.search_workouts('default_user', 'bench press'),
+        'GET /history': history_route,
+    }
+
+def run_size(n_exercises, feed_entries, repeat, seed):
+    with tempfile.TemporaryDirectory(prefix='letslift-bench-') as workspace:
+        generate.use_workspace(workspace)
+        generate.populate_db(n_exercises, seed)
+        generate.populate_feeds(feed_entries, seed)
+
+        import app
+        app.init_db()
+        results = {}
+        for name, func in benchmarks(app).items():
+            results[name] = measure(func, repeat)
+        generate.db.close_db()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark LetsLift hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='number of exercises in the synthetic history')
+    parser.add_argument('--feed-entries', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    # Services log a line per event; keep the report readable
+    logging.disable(logging.INFO)
+    report = {}
+    for size in args.sizes:
+        print(f"\n=== {size} exercises ===")
+        results = run_size(size, args.feed_entries, args.repeat, args.seed)
+        report[size] = {}
+        for name, (seconds, peak) in results.items():
+            report[size][name] = {'seconds': seconds, 'peak_bytes': peak}
+            print(f"{name:<40} {seconds * 1000:>10.2f} ms {peak / 1024:>12.1f} KiB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""A cheap, cross-process version number for the app's data.
+
+Every write that can change what a page shows (saving or importing
+workouts, streak updates, social posts, notifications, progress stats)
+calls bump(), which appends a byte to data/data_version. Reading the
+version is a single stat() of that file - (inode, size, mtime) - so the
+app and the services share it without touching any database.
+"""
+import os
+from datetime import datetime, timezone
+
+import shared_files
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSION_FILE = os.path.join(SCRIPT_DIR, 'data', 'data_version')
+
+# The file is replaced (new inode) once it grows past this
+MAX_FILE_SIZE = 64 * 1024
+
+def bump():
+    """Mark the data as changed."""
+    os.makedirs(os.path.dirname(VERSION_FILE), exist_ok=True)
+    # O_APPEND writes are atomic, so concurrent bumps from several
+    # processes each grow the file; size alone can't be relied on after a
+    # rotation, which is why the inode is part of the version too
+    with open(VERSION_FILE, 'ab') as f:
+        f.write(b'.')
+        size = f.tell()
+    if size > MAX_FILE_SIZE:
+        shared_files.atomic_write(VERSION_FILE, b'.')
+
+def current():
+    """Return (version, last_modified) for the current data."""
+    try:
+        st = os.stat(VERSION_FILE)
+    except FileNotFoundError:
+        return (0, 0, 0), None
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+    return (st.st_ino, st.st_size, st.st_mtime_ns), last_modified
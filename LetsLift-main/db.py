@@ -0,0 +1,318 @@
+"""Pooled SQLite connections and schema migrations for workouts.db.
+
+Every thread keeps one long-lived connection (Flask serves each request on
+a thread, so this is effectively per request) instead of reconnecting on
+every call. Connections run in WAL mode so readers of /history never
+block a writer in finish_workout, and keep a statement cache so repeated
+queries skip re-preparing.
+
+The schema is versioned with PRAGMA user_version: init_db() applies every
+entry of MIGRATIONS newer than the file's version, each in its own
+transaction, so existing workouts.db files are upgraded in place.
+"""
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import SQL_LATENCY, SQL_QUERIES
+
+DB_PATH = 'workouts.db'
+
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',    # durable with WAL, no fsync on every commit
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-8000',      # 8 MB page cache per connection
+    'PRAGMA temp_store=MEMORY',
+)
+
+_local = threading.local()
+
+def _record(sql, started):
+    statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+    SQL_QUERIES.inc(statement)
+    SQL_LATENCY.observe(time.perf_counter() - started, statement)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement counts and timings in metrics."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, started)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(path=None):
+    """Open a new, tuned connection (callers own and close it)."""
+    db = sqlite3.connect(path or DB_PATH, timeout=5, cached_statements=STATEMENT_CACHE_SIZE,
+                         factory=TimedConnection)
+    db.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        db.execute(pragma)
+    return db
+
+def _pool():
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+    return pool
+
+@contextmanager
+def get_db():
+    """Yield this thread's connection to DB_PATH.
+
+    Nested uses share the connection. When the outermost block exits,
+    anything left uncommitted is rolled back so the next user of the
+    connection starts clean.
+    """
+    pool = _pool()
+    entry = pool.get(DB_PATH)
+    if entry is None:
+        entry = pool[DB_PATH] = {'db': connect(DB_PATH), 'depth': 0}
+    db = entry['db']
+    entry['depth'] += 1
+    try:
+        yield db
+    finally:
+        entry['depth'] -= 1
+        if entry['depth'] == 0 and db.in_transaction:
+            db.rollback()
+
+def close_db():
+    """Close this thread's pooled connections."""
+    pool = _pool()
+    for entry in pool.values():
+        entry['db'].close()
+    pool.clear()
+
+def is_bad_weight(weight):
+    """True for numbers no weight can be: nan, inf and overflows like 1e400."""
+    try:
+        return not math.isfinite(float(weight))
+    except (TypeError, ValueError):
+        return False
+
+def parse_weight(weight):
+    """Split a form/legacy weight value into (pounds, is_bodyweight)."""
+    try:
+        pounds = float(weight)
+    except (TypeError, ValueError):
+        # 'Bodyweight' and other non-numeric entries
+        return 0.0, 1
+    if not math.isfinite(pounds):
+        return 0.0, 1
+    return pounds, 0
+
+def to_iso(timestamp):
+    """'YYYY-MM-DD HH:MM' -> 'YYYY-MM-DDTHH:MM:SS' (None stays None)."""
+    if not timestamp:
+        return None
+    iso = timestamp.strip().replace(' ', 'T')
+    if len(iso) == 16:
+        iso += ':00'
+    return iso
+
+def _create_base_tables(db):
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS workouts (
+        id INTEGER PRIMARY KEY,
+        start_time TEXT,
+        end_time TEXT,
+        notes TEXT
+    )''')
+
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS exercises (
+        id INTEGER PRIMARY KEY,
+        workout_id INTEGER,
+        name TEXT,
+        weight TEXT,
+        sets INTEGER,
+        reps INTEGER,
+        FOREIGN KEY (workout_id) REFERENCES workouts (id)
+    )''')
+
+def _add_lookup_indexes(db):
+    db.execute('CREATE INDEX IF NOT EXISTS idx_exercises_workout_id ON exercises (workout_id)')
+
+def _add_typed_columns(db):
+    db.execute('ALTER TABLE exercises ADD COLUMN weight_lbs REAL NOT NULL DEFAULT 0')
+    db.execute('ALTER TABLE exercises ADD COLUMN is_bodyweight INTEGER NOT NULL DEFAULT 0')
+    db.execute('ALTER TABLE workouts ADD COLUMN started_at TEXT')
+    db.execute('ALTER TABLE workouts ADD COLUMN ended_at TEXT')
+
+    db.executemany(
+        'UPDATE exercises SET weight_lbs = ?, is_bodyweight = ? WHERE id = ?',
+        [(*parse_weight(weight), exercise_id)
+         for exercise_id, weight in db.execute('SELECT id, weight FROM exercises').fetchall()]
+    )
+    db.executemany(
+        'UPDATE workouts SET started_at = ?, ended_at = ? WHERE id = ?',
+        [(to_iso(start), to_iso(end), workout_id)
+         for workout_id, start, end in db.execute('SELECT id, start_time, end_time FROM workouts').fetchall()]
+    )
+    db.execute('CREATE INDEX IF NOT EXISTS idx_workouts_started_at ON workouts (started_at)')
+
+def _add_streak_tables(db):
+    # Distinct training days per user, and the maximal runs of consecutive days
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS workout_days (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID''')
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS streak_runs (
+        user_id TEXT NOT NULL,
+        start_day TEXT NOT NULL,
+        end_day TEXT NOT NULL,
+        length INTEGER NOT NULL,
+        PRIMARY KEY (user_id, start_day)
+    ) WITHOUT ROWID''')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_streak_runs_end ON streak_runs (user_id, end_day)')
+    # One row per user so current/longest streak are single lookups
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS streak_summary (
+        user_id TEXT PRIMARY KEY,
+        last_start TEXT NOT NULL,
+        last_end TEXT NOT NULL,
+        longest INTEGER NOT NULL
+    )''')
+
+def _add_user_drafts(db):
+    db.execute("ALTER TABLE workouts ADD COLUMN user_id TEXT NOT NULL DEFAULT 'default_user'")
+    db.execute('CREATE INDEX IF NOT EXISTS idx_workouts_user ON workouts (user_id, id)')
+    # In-progress workouts, one per user; exercises are appended by position
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS drafts (
+        user_id TEXT PRIMARY KEY,
+        start_time TEXT NOT NULL,
+        notes TEXT NOT NULL DEFAULT ''
+    )''')
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS draft_exercises (
+        user_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT,
+        weight TEXT,
+        sets INTEGER,
+        reps INTEGER,
+        PRIMARY KEY (user_id, position)
+    ) WITHOUT ROWID''')
+
+def _add_personal_records(db):
+    # records imports this module, so it can only be imported once loaded
+    from records import compute_records
+    # Best value per (user, exercise, metric), kept current by save_workout()
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS personal_records (
+        user_id TEXT NOT NULL,
+        exercise TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value REAL NOT NULL,
+        workout_id INTEGER NOT NULL,
+        achieved_at TEXT,
+        PRIMARY KEY (user_id, exercise, metric)
+    ) WITHOUT ROWID''')
+    compute_records(db)
+
+def _add_rollups(db):
+    from rollups import compute_rollups
+    # Per-user totals by day ('YYYY-MM-DD') and ISO week ('YYYY-Www'), kept
+    # current by save_workout(); see rollups.py
+    for table, key in (('daily_rollups', 'day'), ('weekly_rollups', 'week')):
+        db.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            user_id TEXT NOT NULL,
+            {key} TEXT NOT NULL,
+            workouts INTEGER NOT NULL DEFAULT 0,
+            volume REAL NOT NULL DEFAULT 0,
+            sets INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, {key})
+        ) WITHOUT ROWID''')
+    compute_rollups(db)
+
+def _add_leaderboards(db):
+    from leaderboards import compute_leaderboards
+    # Per-period scores across users, kept current by save_workout() and the
+    # streak service; ranking happens in memory, see leaderboards.py
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard_scores (
+        board TEXT NOT NULL,
+        period TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        score REAL NOT NULL,
+        seq INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (board, period, user_id)
+    ) WITHOUT ROWID''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_seq ON leaderboard_scores (seq)')
+    compute_leaderboards(db)
+
+def _add_search_index(db):
+    from search import index_all
+    # One FTS5 row per workout (rowid = workout id), kept current by
+    # save_workout() and imports; see search.py
+    db.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS workout_search USING fts5(
+        user_id UNINDEXED,
+        notes,
+        exercises,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )''')
+    index_all(db)
+
+# Append only: a migration's position in this list is its schema version
+MIGRATIONS = [
+    _create_base_tables,
+    _add_lookup_indexes,
+    _add_typed_columns,
+    _add_streak_tables,
+    _add_user_drafts,
+    _add_personal_records,
+    _add_rollups,
+    _add_leaderboards,
+    _add_search_index,
+]
+
+def migrate(db):
+    """Bring an open connection's schema up to date. Returns the new version."""
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if db.execute('PRAGMA user_version').fetchone()[0] >= number:
+                db.rollback()
+                continue
+            migration(db)
+            db.execute(f'PRAGMA user_version = {number}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return len(MIGRATIONS)
+
+def init_db():
+    with get_db() as db:
+        migrate(db)
@@ -0,0 +1,76 @@
+"""Per-user in-progress workouts.
+
+Each user's draft lives in the drafts/draft_exercises tables of
+workouts.db, keyed on the session's user_id, so concurrent users never
+share state and a draft survives an app restart. Adding or undoing a set
+is a single-row insert or delete at the end of the user's exercise list.
+"""
+from db import get_db
+
+def start_draft(user_id, start_time):
+    """Begin a fresh draft for a user, discarding any previous one."""
+    with get_db() as db:
+        db.execute('DELETE FROM draft_exercises WHERE user_id = ?', (user_id,))
+        db.execute(
+            'INSERT OR REPLACE INTO drafts (user_id, start_time, notes) VALUES (?, ?, ?)',
+            (user_id, start_time, '')
+        )
+        db.commit()
+
+def add_draft_exercises(user_id, exercises, start_time=None):
+    """Append exercises to the end of a user's draft."""
+    with get_db() as db:
+        if start_time:
+            db.execute(
+                'INSERT OR IGNORE INTO drafts (user_id, start_time) VALUES (?, ?)',
+                (user_id, start_time)
+            )
+        last = db.execute(
+            'SELECT MAX(position) FROM draft_exercises WHERE user_id = ?', (user_id,)
+        ).fetchone()[0] or 0
+        db.executemany(
+            'INSERT INTO draft_exercises (user_id, position, name, weight, sets, reps) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(user_id, last + offset, ex['name'], ex['weight'], ex['sets'], ex['reps'])
+             for offset, ex in enumerate(exercises, start=1)]
+        )
+        db.commit()
+
+def pop_draft_exercise(user_id):
+    """Remove and return the last exercise of a user's draft (None if empty)."""
+    with get_db() as db:
+        row = db.execute(
+            'SELECT position, name, weight, sets, reps FROM draft_exercises '
+            'WHERE user_id = ? ORDER BY position DESC LIMIT 1',
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            'DELETE FROM draft_exercises WHERE user_id = ? AND position = ?',
+            (user_id, row['position'])
+        )
+        db.commit()
+        return {'name': row['name'], 'weight': row['weight'], 'sets': row['sets'], 'reps': row['reps']}
+
+def load_draft(user_id):
+    """Return a user's draft as a workout dict ({'exercises': []} if none)."""
+    with get_db() as db:
+        draft = db.execute(
+            'SELECT start_time, notes FROM drafts WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        workout = dict(draft) if draft else {}
+        workout['exercises'] = [
+            dict(row) for row in db.execute(
+                'SELECT name, weight, sets, reps FROM draft_exercises '
+                'WHERE user_id = ? ORDER BY position',
+                (user_id,)
+            )
+        ]
+        return workout
+
+def discard_draft(user_id):
+    with get_db() as db:
+        db.execute('DELETE FROM draft_exercises WHERE user_id = ?', (user_id,))
+        db.execute('DELETE FROM drafts WHERE user_id = ?', (user_id,))
+        db.commit()
@@ -0,0 +1,63 @@
+"""Background fan-out of app events to their handlers.
+
+Routes call dispatch() once an event has happened (e.g. a workout was
+committed) and return right away; every handler registered with @on()
+runs on a small thread pool, off the request path. A handler that raises
+is retried with exponential backoff before the failure is logged.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import metrics
+
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5   # seconds before the first retry, doubled after each one
+
+logger = logging.getLogger(__name__)
+
+HANDLER_FAILURES = metrics.Counter(
+    'letslift_event_handler_failures_total', 'Event handler attempts that raised.',
+    labels=('event', 'handler'))
+
+_handlers = {}
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='events')
+_pending = set()
+
+def on(event_name):
+    """Register the decorated function as a handler for event_name."""
+    def register(handler):
+        _handlers.setdefault(event_name, []).append(handler)
+        return handler
+    return register
+
+def _run(event_name, handler, payload):
+    delay = RETRY_DELAY
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return handler(payload)
+        except Exception as e:
+            HANDLER_FAILURES.inc(event_name, handler.__name__)
+            if attempt == MAX_ATTEMPTS:
+                logger.error("%s handler %s failed after %s attempts: %s",
+                             event_name, handler.__name__, attempt, e)
+                raise
+            logger.warning("%s handler %s failed (attempt %s), retrying: %s",
+                           event_name, handler.__name__, attempt, e)
+            time.sleep(delay)
+            delay *= 2
+
+def dispatch(event_name, payload):
+    """Run every handler of event_name in the background. Returns the futures."""
+    futures = []
+    for handler in _handlers.get(event_name, []):
+        future = _executor.submit(_run, event_name, handler, payload)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+        futures.append(future)
+    return futures
+
+def drain(timeout=None):
+    """Block until all dispatched handlers have finished (tests, shutdown)."""
+    wait(list(_pending), timeout=timeout)
@@ -0,0 +1,121 @@
+"""Canonical exercise names and an in-memory prefix index for autocomplete.
+
+Names are matched on a normalized key (case, spacing and hyphens folded),
+so "bench  press", "Bench-Press" and "Bench Press" are one exercise and are
+stored under the first spelling seen (template spellings win). The index
+is a sorted array of keys - every name is also indexed from each later word,
+so "press" finds "Bench Press" - searched with bisect; it is built once
+from SEED_NAMES and the names in workouts.db. Whenever the data version
+changes, exercises saved since (by this or any other worker process) are
+counted in by id.
+"""
+import bisect
+import re
+import threading
+
+import data_version
+from db import get_db
+
+MAX_SUGGESTIONS = 10
+# Keys looked at per query before ranking; bounds very short prefixes
+MAX_SCAN = 256
+
+# Canonical spellings known up front (the app adds its workout templates)
+SEED_NAMES = []
+
+_SEPARATORS = re.compile(r'[\s_\-]+')
+
+def normalize(name):
+    """The matching key of a name: casefolded, with runs of spaces, '-' and '_' as one space."""
+    return _SEPARATORS.sub(' ', name).strip().casefold()
+
+def clean(name):
+    """A name as typed, with stray spacing removed."""
+    return ' '.join(name.split())
+
+class NameIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []      # sorted (search key, name key) pairs
+        self._names = {}     # name key -> [display name, times logged]
+
+    def add(self, name, count=1):
+        """Record uses of a name; a new key keeps this spelling as canonical."""
+        key = normalize(name)
+        if not key:
+            return
+        with self._lock:
+            entry = self._names.get(key)
+            if entry is not None:
+                entry[1] += count
+                return
+            self._names[key] = [clean(name), count]
+            words = key.split(' ')
+            for i in range(len(words)):
+                bisect.insort(self._keys, (' '.join(words[i:]), key))
+
+    def canonical(self, name):
+        """The canonical spelling of name, or name cleaned up if it is new."""
+        entry = self._names.get(normalize(name))
+        return entry[0] if entry is not None else clean(name)
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        """Names with a word starting with prefix, most logged first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (prefix,))
+            matches = {}
+            for search_key, key in self._keys[start:start + MAX_SCAN]:
+                if not search_key.startswith(prefix):
+                    break
+                matches[key] = self._names[key]
+            ranked = sorted(matches.values(), key=lambda entry: (-entry[1], entry[0]))
+        return [name for name, _ in ranked[:limit]]
+
+_index = None
+_index_lock = threading.Lock()
+_synced_version = None
+_synced_id = 0      # highest exercises.id counted into _index
+
+def _catch_up(index, after_id):
+    """Count exercises with ids above after_id into index. Returns the new highest id."""
+    with get_db() as db:
+        last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM exercises').fetchone()[0]
+        if last_id > after_id:
+            # In order of first use, so the first spelling logged becomes canonical
+            for name, count in db.execute(
+                    'SELECT name, COUNT(*) FROM exercises WHERE id > ? AND id <= ? '
+                    'GROUP BY name ORDER BY MIN(id)',
+                    (after_id, last_id)):
+                index.add(name, count)
+    return max(last_id, after_id)
+
+def get_index():
+    global _index, _synced_version, _synced_id
+    version, _ = data_version.current()
+    if _index is None or version != _synced_version:
+        with _index_lock:
+            if _index is None:
+                index = NameIndex()
+                for name in SEED_NAMES:
+                    index.add(name, count=0)
+                _synced_id = _catch_up(index, 0)
+                _synced_version = version
+                _index = index
+            elif version != _synced_version:
+                _synced_id = _catch_up(_index, _synced_id)
+                _synced_version = version
+    return _index
+
+def reset():
+    """Drop the index so the next use reloads it (e.g. after a bulk import)."""
+    global _index
+    _index = None
+
+def canonical_name(name):
+    return get_index().canonical(name)
+
+def suggest(prefix, limit=MAX_SUGGESTIONS):
+    return get_index().search(prefix, limit)
@@ -0,0 +1,32 @@
+"""Production settings: gunicorn -c gunicorn.conf.py app:app
+
+Each worker is a separate process with its own in-memory caches; those
+are revalidated against data_version, and all shared state lives in
+SQLite (WAL) or is written through shared_files, so any number of
+workers can serve the app. Settings can be overridden from the
+environment (LETSLIFT_BIND, LETSLIFT_WORKERS, LETSLIFT_THREADS) or the
+gunicorn command line.
+"""
+import multiprocessing
+import os
+
+# Read by app.py in every worker: debug mode off
+os.environ.setdefault('LETSLIFT_ENV', 'production')
+
+bind = os.environ.get('LETSLIFT_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('LETSLIFT_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('LETSLIFT_THREADS', 4))
+timeout = 60
+# Not preloaded: SQLite connections and the event thread pool must be
+# created after the fork, in each worker
+preload_app = False
+
+def on_starting(server):
+    """Apply schema migrations once, before any worker starts."""
+    import db
+    conn = db.connect(db.DB_PATH)
+    try:
+        db.migrate(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+"""Write-through, in-process cache of each user's recent history.
+
+For every user it has seen, the cache keeps the workout count and the
+newest RECENT_WORKOUTS workouts as compact __slots__ records. That lets
+the home page count and the first history page skip workouts.db.
+save_workout() adds each workout as it commits (add_workout()).
+Workouts saved by other processes (gunicorn workers, imports) are picked
+up by id when the data version changes, so the cache stays exact. At
+most MAX_USERS users are kept; the least recently used is evicted.
+"""
+import threading
+from collections import OrderedDict
+
+import data_version
+from db import get_db
+
+RECENT_WORKOUTS = 50
+MAX_USERS = 1024
+
+class Exercise:
+    __slots__ = ('name', 'weight', 'sets', 'reps')
+
+    def __init__(self, name, weight, sets, reps):
+        self.name = name
+        self.weight = weight
+        self.sets = sets
+        self.reps = reps
+
+    def __getitem__(self, key):
+        # Readable like the dict rows get_workouts() returns
+        return getattr(self, key)
+
+class Workout:
+    __slots__ = ('id', 'start_time', 'end_time', 'notes', 'exercises')
+
+    def __init__(self, workout_id, start_time, end_time, notes, exercises):
+        self.id = workout_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.notes = notes
+        self.exercises = exercises      # tuple of Exercise
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+class UserHistory:
+    __slots__ = ('count', 'recent', 'synced_id', 'version', 'added')
+
+    def __init__(self, count, recent, synced_id, version):
+        self.count = count
+        self.recent = recent            # newest first, at most RECENT_WORKOUTS
+        self.synced_id = synced_id      # every workout up to this id is counted
+        self.version = version
+        self.added = set()              # ids written through since, all above synced_id
+
+_lock = threading.Lock()
+_users = OrderedDict()
+
+def _load(db, user_id, after_id):
+    """(count, last id, newest workouts) of the user's workouts above after_id."""
+    count, last_id = db.execute(
+        'SELECT COUNT(*), COALESCE(MAX(id), 0) FROM workouts WHERE user_id = ? AND id > ?',
+        (user_id, after_id)
+    ).fetchone()
+    if not count:
+        return 0, after_id, []
+    rows = db.execute(
+        'SELECT id, start_time, end_time, notes FROM workouts WHERE user_id = ? AND id > ? '
+        'ORDER BY id DESC LIMIT ?',
+        (user_id, after_id, RECENT_WORKOUTS)
+    ).fetchall()
+    exercises = {}
+    for workout_id, name, weight, sets, reps in db.execute(
+            f'SELECT workout_id, name, weight, sets, reps FROM exercises '
+            f'WHERE workout_id IN ({", ".join("?" * len(rows))}) ORDER BY workout_id, id',
+            [row[0] for row in rows]):
+        exercises.setdefault(workout_id, []).append(Exercise(name, weight, sets, reps))
+    return count, last_id, [Workout(row[0], row[1], row[2], row[3], tuple(exercises.get(row[0], ())))
+                            for row in rows]
+
+def _merge(recent, workouts):
+    by_id = {workout.id: workout for workout in recent}
+    by_id.update((workout.id, workout) for workout in workouts)
+    return sorted(by_id.values(), key=lambda workout: workout.id, reverse=True)[:RECENT_WORKOUTS]
+
+def _entry(user_id):
+    """The user's cached history, loaded or brought up to date as needed. Caller holds _lock."""
+    # Read before querying: any write that lands after this bumps it again
+    version, _ = data_version.current()
+    entry = _users.get(user_id)
+    if entry is None:
+        with get_db() as db:
+            count, last_id, recent = _load(db, user_id, 0)
+        entry = _users[user_id] = UserHistory(count, recent, last_id, version)
+        while len(_users) > MAX_USERS:
+            _users.popitem(last=False)
+    elif entry.version != version:
+        with get_db() as db:
+            count, last_id, workouts = _load(db, user_id, entry.synced_id)
+        # Workouts written through are in the new count already
+        entry.count += count - len(entry.added)
+        entry.recent = _merge(entry.recent, workouts)
+        entry.synced_id = last_id
+        entry.version = version
+        entry.added = set()
+    _users.move_to_end(user_id)
+    return entry
+
+def add_workout(user_id, workout_id, workout):
+    """Write a just-committed workout (start_time, end_time, notes, exercises) through."""
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is None or workout_id <= entry.synced_id or workout_id in entry.added:
+            return
+        entry.count += 1
+        entry.added.add(workout_id)
+        entry.recent = _merge(entry.recent, [Workout(
+            workout_id, workout['start_time'], workout['end_time'], workout.get('notes', ''),
+            tuple(Exercise(e['name'], e['weight'], e['sets'], e['reps']) for e in workout['exercises'])
+        )])
+
+def count(user_id):
+    with _lock:
+        return _entry(user_id).count
+
+def recent(user_id, limit):
+    """The user's newest workouts, newest first; limit must be at most RECENT_WORKOUTS."""
+    with _lock:
+        return list(_entry(user_id).recent[:limit])
+
+def clear():
+    with _lock:
+        _users.clear()
@@ -0,0 +1,300 @@
+"""Streaming bulk import and export of workout history.
+
+Two formats are supported:
+
+  csv   - one row per exercise with the columns in CSV_COLUMNS; consecutive
+          rows with the same workout_id (or, without that column, the same
+          start_time) belong to one workout
+  jsonl - one workout per line: {"start_time", "end_time", "notes",
+          "exercises": [{"name", "weight", "sets", "reps"}, ...]}
+
+Times are 'YYYY-MM-DD HH:MM' or a bare 'YYYY-MM-DD' (midnight), weights a
+finite number or blank/'Bodyweight'; anything else rejects the import.
+
+Imports are parsed lazily and written in a single transaction with
+executemany() in chunks; exports stream rows straight from a cursor, so
+neither side ever holds the whole history in memory.
+
+    python -m history_io import history.csv --user default_user
+    python -m history_io export --format jsonl --output history.jsonl
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import sys
+from datetime import datetime
+
+import data_version
+import events
+import exercise_names
+from db import get_db, init_db, parse_weight, to_iso
+from services import message_queue
+from leaderboards import rebuild_leaderboards
+from records import rebuild_records
+from rollups import rebuild_rollups
+from search import index_workout
+from services.streak import rebuild_streaks
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+TIME_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d')
+CSV_COLUMNS = ['workout_id', 'start_time', 'end_time', 'notes', 'exercise_name', 'weight', 'sets', 'reps']
+
+logger = logging.getLogger(__name__)
+
+class HistoryFormatError(ValueError):
+    """Raised for malformed import data; the whole import is rolled back."""
+
+def detect_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+def _timestamp(line_number, field, value):
+    """value as 'YYYY-MM-DD HH:MM', or HistoryFormatError."""
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).strftime('%Y-%m-%d %H:%M')
+        except (AttributeError, ValueError):
+            continue
+    raise HistoryFormatError(f"line {line_number}: {field} must be YYYY-MM-DD HH:MM, got {value!r}")
+
+def _weight(line_number, weight):
+    """weight as stored: a finite number, or 'Bodyweight' when missing."""
+    # 0 is a weight; only a missing one means bodyweight
+    if weight is None or (isinstance(weight, str) and weight.strip().lower() in ('', 'bodyweight')):
+        return 'Bodyweight'
+    if isinstance(weight, (int, float, str)) and not isinstance(weight, bool):
+        try:
+            if math.isfinite(float(weight)):
+                return weight
+        except ValueError:
+            pass
+    raise HistoryFormatError(f"line {line_number}: weight must be a number or Bodyweight, got {weight!r}")
+
+def _exercise(line_number, name, weight, sets, reps):
+    if not isinstance(name, str) or not name.strip():
+        raise HistoryFormatError(f"line {line_number}: every exercise needs a name")
+    try:
+        sets, reps = int(sets or 0), int(reps or 0)
+    except (ValueError, TypeError, OverflowError):
+        raise HistoryFormatError(f"line {line_number}: sets and reps must be whole numbers")
+    return {'name': name, 'weight': _weight(line_number, weight), 'sets': sets, 'reps': reps}
+
+def iter_csv_workouts(stream):
+    workout = None
+    workout_key = None
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        if not row.get('start_time'):
+            raise HistoryFormatError(f"line {line_number}: start_time is required")
+        key = row.get('workout_id') or row['start_time']
+        if workout is None or key != workout_key:
+            if workout is not None:
+                yield workout
+            workout_key = key
+            start_time = _timestamp(line_number, 'start_time', row['start_time'])
+            end_time = row.get('end_time')
+            workout = {
+                'start_time': start_time,
+                'end_time': _timestamp(line_number, 'end_time', end_time) if end_time else start_time,
+                'notes': row.get('notes') or '',
+                'exercises': []
+            }
+        if row.get('exercise_name'):
+            workout['exercises'].append(_exercise(
+                line_number, row['exercise_name'], row.get('weight'), row.get('sets'), row.get('reps')))
+    if workout is not None:
+        yield workout
+
+def iter_jsonl_workouts(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            workout = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HistoryFormatError(f"line {line_number}: {e}")
+        if not isinstance(workout, dict) or not workout.get('start_time'):
+            raise HistoryFormatError(f"line {line_number}: start_time is required")
+        exercises = []
+        for exercise in workout.get('exercises') or []:
+            if not isinstance(exercise, dict):
+                raise HistoryFormatError(f"line {line_number}: every exercise needs a name")
+            exercises.append(_exercise(line_number, exercise.get('name'), exercise.get('weight'),
+                                       exercise.get('sets'), exercise.get('reps')))
+        start_time = _timestamp(line_number, 'start_time', workout['start_time'])
+        end_time = workout.get('end_time')
+        yield {
+            'start_time': start_time,
+            'end_time': _timestamp(line_number, 'end_time', end_time) if end_time else start_time,
+            'notes': workout.get('notes') or '',
+            'exercises': exercises
+        }
+
+def iter_workouts(stream, fmt):
+    if fmt == 'jsonl':
+        return iter_jsonl_workouts(stream)
+    return iter_csv_workouts(stream)
+
+def import_workouts(workouts, user_id='default_user', chunk_size=CHUNK_SIZE):
+    """Insert an iterable of workout dicts in one transaction.
+
+    Returns (workout_count, exercise_count). Nothing is written if any
+    workout is malformed.
+    """
+    workout_count = 0
+    exercise_count = 0
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # Ids are assigned up front so both tables can use executemany
+            next_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM workouts').fetchone()[0] + 1
+            workout_rows = []
+            exercise_rows = []
+            search_rows = []
+
+            def flush():
+                db.executemany(
+                    'INSERT INTO workouts (id, user_id, start_time, end_time, notes, started_at, ended_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', workout_rows)
+                db.executemany(
+                    'INSERT INTO exercises (workout_id, name, weight, weight_lbs, is_bodyweight, sets, reps) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', exercise_rows)
+                for row in search_rows:
+                    index_workout(db, *row)
+                workout_rows.clear()
+                exercise_rows.clear()
+                search_rows.clear()
+
+            for workout in workouts:
+                workout_id = next_id
+                next_id += 1
+                workout_rows.append((
+                    workout_id, user_id, workout['start_time'], workout['end_time'], workout['notes'],
+                    to_iso(workout['start_time']), to_iso(workout['end_time'])
+                ))
+                names = []
+                for exercise in workout['exercises']:
+                    names.append(exercise_names.canonical_name(exercise['name']))
+                    exercise_rows.append((
+                        workout_id, names[-1], str(exercise['weight']),
+                        *parse_weight(exercise['weight']), exercise['sets'], exercise['reps']
+                    ))
+                search_rows.append((workout_id, user_id, workout['notes'], names))
+                workout_count += 1
+                exercise_count += len(workout['exercises'])
+                if len(workout_rows) + len(exercise_rows) >= chunk_size:
+                    flush()
+            flush()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    if workout_count:
+        data_version.bump()
+        events.dispatch('history_imported', {'user_id': user_id})
+    logger.info("Imported %s workouts / %s exercises for %s", workout_count, exercise_count, user_id)
+    return workout_count, exercise_count
+
+# Derived data can't be updated workout by workout for a bulk load, so it
+# is recomputed for the importing user once the import has committed. The
+# rebuilds run one after another: each holds the workouts.db write lock
+# for its own transaction, and running them side by side would keep
+# saves from the app waiting past busy_timeout.
+@events.on('history_imported')
+def rebuild_after_import(event):
+    user_id = event['user_id']
+    rebuild_streaks(user_id)
+    rebuild_records(user_id)
+    rebuild_rollups(user_id)
+    rebuild_leaderboards(user_id)
+    exercise_names.reset()
+    message_queue.publish('progress', {'user_id': user_id, 'rebuild': True})
+
+def _history_rows(user_id):
+    with get_db() as db:
+        cursor = db.cursor()
+        cursor.row_factory = None
+        yield from cursor.execute(
+            'SELECT w.id, w.start_time, w.end_time, w.notes, e.name, e.weight, e.sets, e.reps '
+            'FROM workouts w LEFT JOIN exercises e ON e.workout_id = w.id '
+            'WHERE w.user_id = ? ORDER BY w.id, e.id',
+            (user_id,)
+        )
+
+def export_csv(user_id='default_user'):
+    """Yield the user's history as CSV text chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in _history_rows(user_id):
+        writer.writerow(['' if value is None else value for value in row])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_jsonl(user_id='default_user'):
+    """Yield the user's history as JSON lines, one workout per line."""
+    workout = None
+    for workout_id, start_time, end_time, notes, name, weight, sets, reps in _history_rows(user_id):
+        if workout is None or workout['id'] != workout_id:
+            if workout is not None:
+                yield json.dumps(workout) + '\n'
+            workout = {'id': workout_id, 'start_time': start_time, 'end_time': end_time,
+                       'notes': notes or '', 'exercises': []}
+        if name is not None:
+            workout['exercises'].append({'name': name, 'weight': weight, 'sets': sets, 'reps': reps})
+    if workout is not None:
+        yield json.dumps(workout) + '\n'
+
+def export_history(user_id='default_user', fmt='csv'):
+    return export_jsonl(user_id) if fmt == 'jsonl' else export_csv(user_id)
+
+def main():
+    parser = argparse.ArgumentParser(description='Import or export LetsLift workout history')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--user', default='default_user')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', parents=[common], help='load workouts from a CSV/JSONL file')
+    import_parser.add_argument('path', help="file to read ('-' for stdin)")
+    import_parser.add_argument('--format', choices=FORMATS)
+    export_parser = commands.add_parser('export', parents=[common], help='write workouts as CSV/JSONL')
+    export_parser.add_argument('--format', choices=FORMATS, default='csv')
+    export_parser.add_argument('--output', default='-', help="file to write ('-' for stdout)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == 'import':
+        fmt = args.format or detect_format(args.path)
+        stream = sys.stdin if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+        try:
+            workouts, exercises = import_workouts(iter_workouts(stream, fmt), args.user)
+        except HistoryFormatError as e:
+            parser.exit(1, f"Import failed: {e}\n")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        # Let derived data (streaks, progress) catch up before exiting
+        events.drain()
+        print(f"Imported {workouts} workouts / {exercises} exercises")
+    else:
+        out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+        try:
+            for chunk in export_history(args.user, args.format):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+if __name__ == '__main__':
+    from logs import setup_logging
+    setup_logging()
+    main()
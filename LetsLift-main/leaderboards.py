@@ -0,0 +1,258 @@
+"""Weekly and monthly leaderboards across users.
+
+leaderboard_scores in workouts.db holds one score per (board, period,
+user): total volume and workout count per ISO week ('YYYY-Www') and month
+('YYYY-MM'), and the longest streak reached in it. save_workout() adds to
+the volume and workout boards in its transaction and the streak service
+raises streak scores as days are logged; each change takes the next seq.
+
+Reads go through an in-memory ordered index per board and period - a
+sorted array of (-score, user) - so top-K is a slice and a user's rank a
+binary search. A process loads a board on first use, then applies only
+rows with a newer seq whenever the data version changes.
+
+    python -m leaderboards --rebuild      # recompute every board from history
+"""
+import argparse
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import data_version
+from db import get_db, init_db
+from rollups import week_key, workout_totals
+
+BOARDS = {
+    'volume': 'Total volume (lbs)',
+    'workouts': 'Workouts',
+    'streak': 'Longest streak (days)',
+}
+PERIODS = ('week', 'month')
+TOP_K = 10
+MAX_TOP_K = 100
+# Boards kept in memory per process, least recently used evicted
+MAX_LOADED_BOARDS = 64
+
+_NEXT_SEQ = '(SELECT COALESCE(MAX(seq), 0) + 1 FROM leaderboard_scores)'
+
+def month_key(day):
+    return day.strftime('%Y-%m')
+
+def period_key(day, period):
+    return week_key(day) if period == 'week' else month_key(day)
+
+def _periods_between(first, last):
+    """(key, last day) of every week and month overlapping first..last."""
+    monday = first - timedelta(days=first.weekday())
+    while monday <= last:
+        yield week_key(monday), monday + timedelta(days=6)
+        monday += timedelta(days=7)
+    month = first.replace(day=1)
+    while month <= last:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        yield month_key(month), next_month - timedelta(days=1)
+        month = next_month
+
+def _streak_scores(start, first, last):
+    """Streak reached in each period overlapping first..last, for a run beginning on start."""
+    for key, period_end in _periods_between(first, last):
+        yield key, (min(last, period_end) - start).days + 1
+
+def update_leaderboards(db, user_id, started_at, exercises):
+    """Add a newly saved workout to the volume and workout boards. Runs in the caller's transaction."""
+    if not started_at:
+        return
+    day = date.fromisoformat(started_at[:10])
+    volume, _ = workout_totals(exercises)
+    for period in PERIODS:
+        for board, amount in (('volume', volume), ('workouts', 1)):
+            db.execute(
+                'INSERT INTO leaderboard_scores (board, period, user_id, score, seq) '
+                f'VALUES (?, ?, ?, ?, {_NEXT_SEQ}) '
+                'ON CONFLICT (board, period, user_id) DO UPDATE SET '
+                'score = score + excluded.score, seq = excluded.seq',
+                (board, period_key(day, period), user_id, amount)
+            )
+
+def record_streak(db, user_id, start, first, last):
+    """Credit a run of training days starting on start ('YYYY-MM-DD') whose days
+    first..last just changed (streak.add_workout_day). Runs in the caller's transaction.
+
+    Logging today only touches this week and month; a backfilled day that
+    joins two runs updates every period the later run spans.
+    """
+    start = date.fromisoformat(start)
+    for key, length in _streak_scores(start, date.fromisoformat(first), date.fromisoformat(last)):
+        db.execute(
+            'INSERT INTO leaderboard_scores (board, period, user_id, score, seq) '
+            f"VALUES ('streak', ?, ?, ?, {_NEXT_SEQ}) "
+            'ON CONFLICT (board, period, user_id) DO UPDATE SET '
+            'score = MAX(score, excluded.score), seq = excluded.seq',
+            (key, user_id, length)
+        )
+
+def compute_leaderboards(db, user_id=None, seq=0):
+    """Write every score computed from the workout history (all users by default).
+
+    Runs in the caller's transaction; each score written takes seq. Also
+    backfills the table when it is created (db._add_leaderboards).
+    Returns the number of scores.
+    """
+    user_filter = '' if user_id is None else 'AND w.user_id = ?'
+    params = () if user_id is None else (user_id,)
+    scores = {}
+    days = db.execute(
+        'SELECT w.user_id, substr(w.started_at, 1, 10), COUNT(DISTINCT w.id), '
+        '       COALESCE(SUM(e.weight_lbs * e.sets * e.reps), 0) '
+        'FROM workouts w LEFT JOIN exercises e ON e.workout_id = w.id '
+        f'WHERE w.started_at IS NOT NULL {user_filter} '
+        'GROUP BY w.user_id, substr(w.started_at, 1, 10) ORDER BY 1, 2',
+        params
+    ).fetchall()
+    run = None
+    for user, day, workouts, volume in days:
+        day = date.fromisoformat(day)
+        for period in PERIODS:
+            key = period_key(day, period)
+            scores[('volume', key, user)] = scores.get(('volume', key, user), 0.0) + volume
+            scores[('workouts', key, user)] = scores.get(('workouts', key, user), 0) + workouts
+        # Days are sorted per user, so runs of consecutive days come in order
+        if run and run[0] == user and run[2] == day - timedelta(days=1):
+            run[2] = day
+        else:
+            run = [user, day, day]
+        for key, length in _streak_scores(run[1], day, day):
+            scores[('streak', key, user)] = max(scores.get(('streak', key, user), 0), length)
+
+    db.executemany(
+        'INSERT INTO leaderboard_scores (board, period, user_id, score, seq) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (board, period, user_id) DO UPDATE SET score = excluded.score, seq = excluded.seq',
+        [(board, key, user, score, seq) for (board, key, user), score in scores.items()]
+    )
+    return len(scores)
+
+def rebuild_leaderboards(user_id=None):
+    """Recompute the boards from workouts.db (all users by default).
+
+    Old scores are zeroed rather than deleted, so processes that have a
+    board loaded see the change through seq like any other update.
+    """
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        seq = db.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM leaderboard_scores').fetchone()[0]
+        if user_id is None:
+            db.execute('UPDATE leaderboard_scores SET score = 0, seq = ?', (seq,))
+        else:
+            db.execute('UPDATE leaderboard_scores SET score = 0, seq = ? WHERE user_id = ?', (seq, user_id))
+        count = compute_leaderboards(db, user_id, seq)
+        db.commit()
+    data_version.bump()
+    return count
+
+class Board:
+    """One leaderboard: a sorted array of (-score, user_id) plus each user's score."""
+
+    def __init__(self, scores):
+        self._scores = {user: score for user, score in scores if score > 0}
+        self._keys = sorted((-score, user) for user, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def set(self, user_id, score):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+        # A zeroed score (see rebuild_leaderboards) leaves the board
+        if score > 0:
+            self._scores[user_id] = score
+            bisect.insort(self._keys, (-score, user_id))
+
+    def rank_of_score(self, score):
+        """1 + the number of users with a higher score, so ties share a rank."""
+        return bisect.bisect_left(self._keys, (-score,)) + 1
+
+    def rank(self, user_id):
+        score = self._scores.get(user_id)
+        return None if score is None else (self.rank_of_score(score), score)
+
+    def top(self, limit):
+        return [(user, -negative) for negative, user in self._keys[:limit]]
+
+_lock = threading.Lock()
+_boards = OrderedDict()
+_synced_seq = None
+_synced_version = None
+
+def _sync(db):
+    """Apply score changes made since the last sync to the loaded boards. Caller holds _lock."""
+    global _synced_seq, _synced_version
+    version, _ = data_version.current()
+    if version == _synced_version:
+        return
+    if _synced_seq is None:
+        # Nothing loaded yet; boards read their rows when first used
+        _synced_seq = db.execute('SELECT COALESCE(MAX(seq), 0) FROM leaderboard_scores').fetchone()[0]
+    else:
+        for board, key, user_id, score, seq in db.execute(
+                'SELECT board, period, user_id, score, seq FROM leaderboard_scores WHERE seq > ?',
+                (_synced_seq,)):
+            loaded = _boards.get((board, key))
+            if loaded is not None:
+                loaded.set(user_id, score)
+            _synced_seq = max(_synced_seq, seq)
+    _synced_version = version
+
+def _board(db, board, key):
+    """The loaded board for (board, period key). Caller holds _lock."""
+    _sync(db)
+    loaded = _boards.get((board, key))
+    if loaded is None:
+        loaded = _boards[(board, key)] = Board(db.execute(
+            'SELECT user_id, score FROM leaderboard_scores WHERE board = ? AND period = ?', (board, key)
+        ).fetchall())
+        while len(_boards) > MAX_LOADED_BOARDS:
+            _boards.popitem(last=False)
+    _boards.move_to_end((board, key))
+    return loaded
+
+def get_leaderboard(board, period='week', key=None, limit=TOP_K, user_id=None):
+    """The top `limit` users of a board for a period, and user_id's own rank.
+
+    key selects the week ('YYYY-Www') or month ('YYYY-MM'); the current one
+    by default. Returns {'board', 'label', 'period', 'key', 'users',
+    'entries': [{'rank', 'user_id', 'score'}, ...], 'me': {'rank', 'score'} or None}.
+    """
+    if board not in BOARDS:
+        raise ValueError(f'unknown board {board!r}; choose from {", ".join(BOARDS)}')
+    if period not in PERIODS:
+        raise ValueError(f'unknown period {period!r}; choose from {", ".join(PERIODS)}')
+    key = key or period_key(date.today(), period)
+    limit = max(1, min(limit, MAX_TOP_K))
+    with get_db() as db, _lock:
+        loaded = _board(db, board, key)
+        entries = [{'rank': loaded.rank_of_score(score), 'user_id': user, 'score': round(score, 1)}
+                   for user, score in loaded.top(limit)]
+        mine = loaded.rank(user_id) if user_id is not None else None
+        users = len(loaded)
+    return {
+        'board': board,
+        'label': BOARDS[board],
+        'period': period,
+        'key': key,
+        'users': users,
+        'entries': entries,
+        'me': None if mine is None else {'rank': mine[0], 'score': round(mine[1], 1)},
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LetsLift leaderboards')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the leaderboards from workouts.db')
+    parser.add_argument('--user', help='only rebuild this user')
+    args = parser.parse_args()
+    init_db()
+    if args.rebuild:
+        print(f"Rebuilt {rebuild_leaderboards(args.user)} leaderboard scores")
+    else:
+        parser.print_help()
@@ -0,0 +1,48 @@
+"""Logging setup shared by the app and the services.
+
+The level comes from LETSLIFT_LOG_LEVEL (default INFO). A rate-limiting
+filter lets each distinct message template through at most BURST times
+per INTERVAL seconds and reports how many were suppressed, so a hot loop
+can't flood the console.
+"""
+import logging
+import os
+import threading
+import time
+
+INTERVAL = 10.0
+BURST = 5
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=INTERVAL, burst=BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                started, count, suppressed = now, 0, 0
+            if count >= self.burst:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, suppressed)
+            return True
+
+def setup_logging(level=None):
+    """Configure the root logger once per process."""
+    root = logging.getLogger()
+    if any(isinstance(f, RateLimitFilter) for h in root.handlers for f in h.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(RateLimitFilter())
+    root.addHandler(handler)
+    root.setLevel(level or os.environ.get('LETSLIFT_LOG_LEVEL', 'INFO').upper())
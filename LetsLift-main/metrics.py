@@ -0,0 +1,107 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are kept per label set behind a lock; collectors
+registered with register_collector() are called at scrape time for values
+that live elsewhere (e.g. queue depth in data/queue.db). render() produces
+the text served by the app's /metrics endpoint.
+"""
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_metrics = []
+_collectors = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bucket_labels = self.labels + ('le',)
+        for label_values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, label_values + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, label_values + ("+Inf",))} {series["count"]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {series["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {series["count"]}')
+        return lines
+
+def register_collector(collector):
+    """Register a callable returning [(name, type, help, labels_dict, value), ...]."""
+    _collectors.append(collector)
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.extend(metric.render())
+    # Exposition format wants each family's samples together
+    families = {}
+    for collector in _collectors:
+        for name, metric_type, documentation, labels, value in collector():
+            family = families.setdefault(name, (metric_type, documentation, []))
+            family[2].append(f'{name}{_format_labels(labels.keys(), labels.values())} {value}')
+    for name, (metric_type, documentation, samples) in families.items():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+# Shared metrics, recorded by app.py and db.py
+REQUEST_LATENCY = Histogram(
+    'letslift_request_duration_seconds', 'Time spent handling HTTP requests.',
+    labels=('endpoint', 'method', 'status'))
+SQL_QUERIES = Counter(
+    'letslift_sql_queries_total', 'SQL statements executed through get_db().',
+    labels=('statement',))
+SQL_LATENCY = Histogram(
+    'letslift_sql_query_duration_seconds', 'Time spent executing SQL statements.',
+    labels=('statement',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0))
@@ -0,0 +1,110 @@
+"""Rendered-page cache and conditional GET for read-only pages.
+
+Validity is checked against data_version.current(), a stat() of a file
+that every relevant write bumps, so a repeat view costs no queries.
+
+Pages wrapped with @cached are keyed on the user, the full path, the data
+version and today's date (streaks and trends roll over at midnight). A
+request carrying the current ETag gets a 304; otherwise a cached body is
+served if there is one, and a miss renders normally while the streamed
+body is recorded for next time.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+import data_version
+import metrics
+
+MAX_ENTRIES = 128
+
+CACHE_REQUESTS = metrics.Counter(
+    'letslift_page_cache_requests_total', 'Cacheable page requests by outcome.',
+    labels=('endpoint', 'outcome'))
+
+_lock = threading.Lock()
+_pages = OrderedDict()
+
+def clear():
+    with _lock:
+        _pages.clear()
+
+def _store(key, etag, last_modified, mimetype, chunks):
+    with _lock:
+        _pages[key] = (etag, last_modified, mimetype, b''.join(chunks))
+        _pages.move_to_end(key)
+        while len(_pages) > MAX_ENTRIES:
+            _pages.popitem(last=False)
+
+def _recording(body, mimetype, key, etag, last_modified):
+    """Pass the body through unchanged and cache it once fully sent."""
+    chunks = []
+    for chunk in body:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        chunks.append(chunk)
+        yield chunk
+    _store(key, etag, last_modified, mimetype, chunks)
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    # Last-Modified only has one-second resolution; a write later in the
+    # same second must not look unmodified, hence the strict comparison
+    return (last_modified is not None and request.if_modified_since is not None
+            and last_modified < request.if_modified_since)
+
+def _finish(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Per-user pages: browsers may keep them but must revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached(user_id_func):
+    """Cache a GET view per user; user_id_func() returns the current user."""
+    def decorate(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            endpoint = request.endpoint
+            # Pending flash messages are shown once, so that page is never cached
+            if request.method != 'GET' or session.get('_flashes'):
+                CACHE_REQUESTS.inc(endpoint, 'bypass')
+                return view(*args, **kwargs)
+
+            user_id = user_id_func()
+            version, last_modified = data_version.current()
+            key = (user_id, request.full_path)
+            etag = hashlib.sha1(
+                repr((key, version, date.today().isoformat())).encode()
+            ).hexdigest()
+
+            if _not_modified(etag, last_modified):
+                CACHE_REQUESTS.inc(endpoint, 'not_modified')
+                return _finish(Response(status=304), etag, last_modified)
+
+            with _lock:
+                entry = _pages.get(key)
+                if entry is not None and entry[0] == etag:
+                    _pages.move_to_end(key)
+            if entry is not None and entry[0] == etag:
+                CACHE_REQUESTS.inc(endpoint, 'hit')
+                _, cached_modified, mimetype, body = entry
+                return _finish(Response(body, mimetype=mimetype), etag, cached_modified)
+
+            CACHE_REQUESTS.inc(endpoint, 'miss')
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            # The version was read before rendering, so a write that lands
+            # mid-render leaves this entry under the old ETag
+            response.response = _recording(response.response, response.mimetype, key, etag, last_modified)
+            return _finish(response, etag, last_modified)
+        return wrapper
+    return decorate
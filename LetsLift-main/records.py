@@ -0,0 +1,109 @@
+"""Personal records per user and exercise.
+
+The personal_records table in workouts.db holds one row per (user,
+exercise, metric) with the best value so far and the workout it came
+from. save_workout() folds each new workout in with primary-key lookups,
+so detecting a PR never scans the exercise history. Bodyweight entries
+have no load and don't count.
+"""
+import data_version
+from db import get_db, parse_weight
+
+# metric -> (label, SQL expression over exercises e)
+METRICS = {
+    'weight': ('Heaviest weight', 'e.weight_lbs'),
+    'e1rm': ('Best est. 1RM', 'e.weight_lbs * (1 + e.reps / 30.0)'),
+    'volume': ('Best set volume', 'e.weight_lbs * e.reps'),
+}
+
+def exercise_metrics(weight, reps):
+    """The record metrics of one exercise entry, or {} if it doesn't qualify."""
+    weight_lbs, is_bodyweight = parse_weight(weight)
+    if is_bodyweight or weight_lbs <= 0 or reps <= 0:
+        return {}
+    return {
+        'weight': weight_lbs,
+        # Epley, as in analytics.estimated_1rm
+        'e1rm': weight_lbs * (1 + reps / 30.0),
+        'volume': weight_lbs * reps,
+    }
+
+def update_records(db, user_id, workout_id, achieved_at, exercises):
+    """Fold a newly saved workout into the user's records.
+
+    Runs in the caller's transaction. Returns the records it set as
+    [{'exercise', 'metric', 'label', 'value', 'previous'}, ...]; previous
+    is None the first time an exercise is logged.
+    """
+    new_records = {}
+    for exercise in exercises:
+        for metric, value in exercise_metrics(exercise['weight'], exercise['reps']).items():
+            key = (exercise['name'], metric)
+            row = db.execute(
+                'SELECT value FROM personal_records WHERE user_id = ? AND exercise = ? AND metric = ?',
+                (user_id, exercise['name'], metric)
+            ).fetchone()
+            if row is not None and value <= row['value']:
+                continue
+            db.execute(
+                'INSERT OR REPLACE INTO personal_records '
+                '(user_id, exercise, metric, value, workout_id, achieved_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (user_id, exercise['name'], metric, value, workout_id, achieved_at)
+            )
+            # A later set in the same workout may beat an earlier one
+            previous = new_records[key]['previous'] if key in new_records else (row['value'] if row else None)
+            new_records[key] = {
+                'exercise': exercise['name'],
+                'metric': metric,
+                'label': METRICS[metric][0],
+                'value': round(value, 1),
+                'previous': None if previous is None else round(previous, 1),
+            }
+    return list(new_records.values())
+
+def get_records(user_id):
+    """The user's records as [{'exercise', 'weight', 'e1rm', 'volume'}, ...] by exercise name."""
+    with get_db() as db:
+        rows = db.execute(
+            'SELECT exercise, metric, value, achieved_at FROM personal_records WHERE user_id = ? '
+            'ORDER BY exercise',
+            (user_id,)
+        ).fetchall()
+    records = {}
+    for row in rows:
+        record = records.setdefault(row['exercise'], {'exercise': row['exercise']})
+        record[row['metric']] = round(row['value'], 1)
+        if row['metric'] == 'weight':
+            record['achieved_at'] = row['achieved_at']
+    return list(records.values())
+
+def compute_records(db, user_id=None):
+    """Insert records computed from the exercise history (all users by default).
+
+    Runs in the caller's transaction, on a table with no rows for those
+    users; also backfills the table when it is created (db._add_personal_records).
+    """
+    user_filter = '' if user_id is None else 'AND w.user_id = ?'
+    params = () if user_id is None else (user_id,)
+    for metric, (_, expression) in METRICS.items():
+        # SQLite takes the bare columns from the row that holds the MAX()
+        db.execute(
+            'INSERT INTO personal_records (user_id, exercise, metric, value, workout_id, achieved_at) '
+            f"SELECT w.user_id, e.name, '{metric}', MAX({expression}), w.id, w.started_at "
+            'FROM exercises e JOIN workouts w ON w.id = e.workout_id '
+            f'WHERE e.is_bodyweight = 0 AND e.weight_lbs > 0 AND e.reps > 0 {user_filter} '
+            'GROUP BY w.user_id, e.name',
+            params
+        )
+
+def rebuild_records(user_id=None):
+    """Recompute records from the exercise history (all users by default)."""
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        if user_id is None:
+            db.execute('DELETE FROM personal_records')
+        else:
+            db.execute('DELETE FROM personal_records WHERE user_id = ?', (user_id,))
+        compute_records(db, user_id)
+        db.commit()
+    data_version.bump()
@@ -0,0 +1,192 @@
+"""Materialized per-user daily and ISO-weekly training totals.
+
+daily_rollups and weekly_rollups in workouts.db hold workout count, total
+volume (lbs x sets x reps) and set count per user per day / ISO week.
+save_workout() adds each workout to both, so any date range is answered
+from at most a few hundred rollup rows: whole weeks come from the weekly
+table and only the partial weeks at either end from the daily one.
+
+    python -m rollups --rebuild      # recompute both tables from history
+"""
+import argparse
+import math
+from datetime import date, timedelta
+
+import data_version
+from db import get_db, init_db, parse_weight
+
+HEATMAP_DAYS = 365
+HEATMAP_LEVELS = 4
+# Longest range the day-by-day listing returns
+MAX_RANGE_DAYS = 366 * 5
+
+def week_key(day):
+    year, week, _ = day.isocalendar()
+    return f'{year}-W{week:02d}'
+
+def workout_totals(exercises):
+    """(volume, sets) of one workout; bodyweight sets add no volume."""
+    volume = 0.0
+    sets = 0
+    for exercise in exercises:
+        weight_lbs, _ = parse_weight(exercise['weight'])
+        volume += weight_lbs * exercise['sets'] * exercise['reps']
+        sets += exercise['sets']
+    return volume, sets
+
+def update_rollups(db, user_id, started_at, exercises):
+    """Add a newly saved workout to its day and week. Runs in the caller's transaction."""
+    if not started_at:
+        return
+    day = date.fromisoformat(started_at[:10])
+    volume, sets = workout_totals(exercises)
+    for table, key, value in (('daily_rollups', 'day', day.isoformat()),
+                              ('weekly_rollups', 'week', week_key(day))):
+        db.execute(
+            f'INSERT INTO {table} (user_id, {key}, workouts, volume, sets) VALUES (?, ?, 1, ?, ?) '
+            f'ON CONFLICT (user_id, {key}) DO UPDATE SET '
+            'workouts = workouts + 1, volume = volume + excluded.volume, sets = sets + excluded.sets',
+            (user_id, value, volume, sets)
+        )
+
+def compute_rollups(db, user_id=None):
+    """Insert rollups computed from the workout history (all users by default).
+
+    Runs in the caller's transaction, on tables with no rows for those
+    users; also backfills them when they are created (db._add_rollups).
+    Returns the number of training days.
+    """
+    user_filter = '' if user_id is None else 'AND w.user_id = ?'
+    params = () if user_id is None else (user_id,)
+    days = db.execute(
+        'SELECT w.user_id, substr(w.started_at, 1, 10), COUNT(DISTINCT w.id), '
+        '       COALESCE(SUM(e.weight_lbs * e.sets * e.reps), 0), COALESCE(SUM(e.sets), 0) '
+        'FROM workouts w LEFT JOIN exercises e ON e.workout_id = w.id '
+        f'WHERE w.started_at IS NOT NULL {user_filter} '
+        'GROUP BY w.user_id, substr(w.started_at, 1, 10)',
+        params
+    ).fetchall()
+    # SQLite has no ISO week format, so weeks are summed up from the days here
+    weeks = {}
+    for user, day, workouts, volume, sets in days:
+        totals = weeks.setdefault((user, week_key(date.fromisoformat(day))), [0, 0.0, 0])
+        totals[0] += workouts
+        totals[1] += volume
+        totals[2] += sets
+    db.executemany(
+        'INSERT INTO daily_rollups (user_id, day, workouts, volume, sets) VALUES (?, ?, ?, ?, ?)',
+        [tuple(row) for row in days]
+    )
+    db.executemany(
+        'INSERT INTO weekly_rollups (user_id, week, workouts, volume, sets) VALUES (?, ?, ?, ?, ?)',
+        [(user, week, *totals) for (user, week), totals in weeks.items()]
+    )
+    return len(days)
+
+def rebuild_rollups(user_id=None):
+    """Recompute the rollups from the workout history (all users by default)."""
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        for table in ('daily_rollups', 'weekly_rollups'):
+            if user_id is None:
+                db.execute(f'DELETE FROM {table}')
+            else:
+                db.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+        days = compute_rollups(db, user_id)
+        db.commit()
+    data_version.bump()
+    return days
+
+def _rows(db, table, key, user_id, first, last):
+    return db.execute(
+        f'SELECT {key}, workouts, volume, sets FROM {table} '
+        f'WHERE user_id = ? AND {key} BETWEEN ? AND ? ORDER BY {key}',
+        (user_id, first, last)
+    ).fetchall()
+
+def _entry(key, workouts, volume, sets):
+    return {'period': key, 'workouts': workouts, 'volume': round(volume, 1), 'sets': sets}
+
+def get_range(user_id, start, end, granularity='day'):
+    """Totals for start..end (dates, inclusive), with one row per active day or week."""
+    if end < start:
+        raise ValueError('end is before start')
+    if granularity == 'day' and (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'day listings are limited to {MAX_RANGE_DAYS} days; use granularity=week')
+
+    # Whole ISO weeks inside the range, Monday through Sunday
+    first_monday = start + timedelta(days=-start.weekday() % 7)
+    last_sunday = end - timedelta(days=(end.weekday() + 1) % 7)
+    with get_db() as db:
+        if granularity == 'week' and first_monday < last_sunday:
+            edge_days = (_rows(db, 'daily_rollups', 'day', user_id, start.isoformat(),
+                               (first_monday - timedelta(days=1)).isoformat())
+                         + _rows(db, 'daily_rollups', 'day', user_id,
+                                 (last_sunday + timedelta(days=1)).isoformat(), end.isoformat()))
+            weeks = {row['week']: [row['workouts'], row['volume'], row['sets']]
+                     for row in _rows(db, 'weekly_rollups', 'week', user_id,
+                                      week_key(first_monday), week_key(last_sunday))}
+        else:
+            edge_days = _rows(db, 'daily_rollups', 'day', user_id, start.isoformat(), end.isoformat())
+            weeks = {}
+
+    if granularity == 'week':
+        for row in edge_days:
+            totals = weeks.setdefault(week_key(date.fromisoformat(row['day'])), [0, 0.0, 0])
+            totals[0] += row['workouts']
+            totals[1] += row['volume']
+            totals[2] += row['sets']
+        rows = [_entry(key, *weeks[key]) for key in sorted(weeks)]
+    else:
+        rows = [_entry(row['day'], row['workouts'], row['volume'], row['sets']) for row in edge_days]
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'totals': {
+            'workouts': sum(row['workouts'] for row in rows),
+            'volume': round(sum(row['volume'] for row in rows), 1),
+            'sets': sum(row['sets'] for row in rows),
+        },
+        'rows': rows,
+    }
+
+def get_heatmap(user_id, end=None, days=HEATMAP_DAYS):
+    """Calendar heatmap cells for the `days` days up to end, starting on a Monday.
+
+    Each cell is {'day', 'workouts', 'volume', 'level'}; level runs from 0
+    (rest day) to HEATMAP_LEVELS relative to the busiest day shown.
+    """
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    start -= timedelta(days=start.weekday())
+    with get_db() as db:
+        active = {row['day']: row for row in
+                  _rows(db, 'daily_rollups', 'day', user_id, start.isoformat(), end.isoformat())}
+    peak = max((row['volume'] for row in active.values()), default=0) or 1.0
+
+    cells = []
+    # Counted rather than stepped past end, which may be date.max
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        row = active.get(day.isoformat())
+        if row is None:
+            cells.append({'day': day.isoformat(), 'workouts': 0, 'volume': 0, 'level': 0})
+        else:
+            # Any training day is at least level 1, even bodyweight-only ones
+            level = max(1, math.ceil(row['volume'] / peak * HEATMAP_LEVELS))
+            cells.append({'day': day.isoformat(), 'workouts': row['workouts'],
+                          'volume': round(row['volume'], 1), 'level': level})
+    return cells
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LetsLift daily/weekly rollups')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from workouts.db')
+    parser.add_argument('--user', help='only rebuild this user')
+    args = parser.parse_args()
+    init_db()
+    if args.rebuild:
+        print(f"Rebuilt rollups from {rebuild_rollups(args.user)} training days")
+    else:
+        parser.print_help()
@@ -0,0 +1,147 @@
+"""Full-text search over workout notes and exercise names.
+
+workout_search in workouts.db is an FTS5 table with one row per workout
+(rowid = workout id): its notes and the names of its exercises, stemmed
+so "squat" finds "Squats". save_workout() and bulk imports index each
+workout in the same transaction that stores it. Results are ranked by
+bm25 and paged. Scoring every match of a common word ("squat") in a long
+log is what makes FTS queries slow, so only the newest MAX_CANDIDATES
+matching workouts are ranked; finding them is a walk down the index.
+
+    python -m search --rebuild      # re-index every workout, e.g. after editing workouts.db
+    python -m search "bench pr" --user default_user
+"""
+import argparse
+import re
+
+from db import get_db, init_db
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Longest query accepted, in words
+MAX_TERMS = 16
+# Newest matches ranked per query
+MAX_CANDIDATES = 1000
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def match_query(text):
+    """An FTS5 query for free text: every word must match, the last one as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation typed into the box
+    are searched for as text instead of raising syntax errors. Only the
+    last word, possibly still being typed, is a prefix: prefix lookups
+    merge every matching term and cost much more than whole words.
+    """
+    words = [f'"{word}"' for word in _WORD.findall(text)[:MAX_TERMS]]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+def index_workout(db, workout_id, user_id, notes, exercise_names):
+    """Add a newly saved workout to the index. Runs in the caller's transaction."""
+    db.execute(
+        'INSERT INTO workout_search (rowid, user_id, notes, exercises) VALUES (?, ?, ?, ?)',
+        (workout_id, user_id, notes or '', ' '.join(exercise_names))
+    )
+
+def index_all(db):
+    """Index every workout into an empty index.
+
+    Runs in the caller's transaction; also backfills the index when it is
+    created (db._add_search_index).
+    """
+    db.execute('''
+    INSERT INTO workout_search (rowid, user_id, notes, exercises)
+    SELECT w.id, w.user_id, COALESCE(w.notes, ''), COALESCE(group_concat(e.name, ' '), '')
+    FROM workouts w LEFT JOIN exercises e ON e.workout_id = w.id
+    GROUP BY w.id''')
+
+def rebuild_search():
+    """Re-index every workout. Returns the number indexed."""
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('DELETE FROM workout_search')
+        index_all(db)
+        count = db.execute('SELECT COUNT(*) FROM workout_search').fetchone()[0]
+        # Merge the index b-trees so queries touch as few pages as possible
+        db.execute("INSERT INTO workout_search (workout_search) VALUES ('optimize')")
+        db.commit()
+    return count
+
+def search_workouts(user_id, text, page=1, page_size=PAGE_SIZE):
+    """A page of the user's workouts matching text, best match first.
+
+    Returns {'query', 'page', 'page_size', 'next_page', 'results': [{'workout_id',
+    'start_time', 'notes', 'exercises', 'snippet', 'score'}, ...]}; next_page is
+    None on the last page.
+    """
+    page = max(1, page)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    result = {'query': text, 'page': page, 'page_size': page_size, 'next_page': None, 'results': []}
+    query = match_query(text)
+    if not query:
+        return result
+
+    with get_db() as db:
+        oldest = db.execute(
+            'SELECT rowid FROM workout_search WHERE workout_search MATCH ? AND user_id = ? '
+            'ORDER BY rowid DESC LIMIT 1 OFFSET ?',
+            (query, user_id, MAX_CANDIDATES - 1)
+        ).fetchone()
+        rows = db.execute(
+            "SELECT rowid, rank, snippet(workout_search, -1, '[', ']', '...', 12) AS snippet "
+            'FROM workout_search WHERE workout_search MATCH ? AND user_id = ? AND rowid >= ? '
+            'ORDER BY rank, rowid DESC LIMIT ? OFFSET ?',
+            (query, user_id, oldest[0] if oldest else 0, page_size + 1, (page - 1) * page_size)
+        ).fetchall()
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            result['next_page'] = page + 1
+        if not rows:
+            return result
+
+        ids = [row['rowid'] for row in rows]
+        placeholders = ', '.join('?' * len(ids))
+        workouts = {row['id']: row for row in db.execute(
+            f'SELECT id, start_time, notes FROM workouts WHERE id IN ({placeholders})', ids)}
+        exercises = {}
+        for row in db.execute(
+                f'SELECT workout_id, name FROM exercises WHERE workout_id IN ({placeholders}) '
+                'ORDER BY workout_id, id', ids):
+            exercises.setdefault(row['workout_id'], []).append(row['name'])
+
+    for row in rows:
+        workout = workouts.get(row['rowid'])
+        if workout is None:
+            continue
+        result['results'].append({
+            'workout_id': workout['id'],
+            'start_time': workout['start_time'],
+            'notes': workout['notes'],
+            'exercises': exercises.get(workout['id'], []),
+            # The best matching notes or exercise names, matched words in [brackets]
+            'snippet': row['snippet'],
+            # bm25 is lower for better matches; flip it so higher is better
+            'score': round(-row['rank'], 3),
+        })
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search LetsLift workout notes and exercises')
+    parser.add_argument('query', nargs='?', help='words to search for')
+    parser.add_argument('--user', default='default_user')
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--rebuild', action='store_true', help='re-index every workout in workouts.db')
+    args = parser.parse_args()
+    init_db()
+    if args.rebuild:
+        print(f"Indexed {rebuild_search()} workouts")
+    if args.query:
+        found = search_workouts(args.user, args.query, args.page)
+        for entry in found['results']:
+            print(f"{entry['start_time']}  {', '.join(entry['exercises'])}  {entry['notes'] or ''}")
+        if found['next_page']:
+            print(f"More: --page {found['next_page']}")
+    elif not args.rebuild:
+        parser.print_help()
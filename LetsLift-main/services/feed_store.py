@@ -0,0 +1,225 @@
+"""Append-only storage for the social and notification feeds.
+
+Entries are appended to per-feed tables in data/feeds.db and read back
+newest-first a page at a time, so neither writes nor reads depend on how
+long a feed has grown. compact() moves everything but the newest
+MAX_LIVE_ENTRIES of a feed into a gzipped JSONL archive under
+data/archive/; the services run it once their queue has been quiet for
+message_queue.IDLE_TIMEOUT, never per write. Notifications additionally
+get per-user indexes and unread counters (see SCHEMA_MIGRATIONS).
+"""
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+import data_version
+import shared_files
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'data')
+FEEDS_DB = os.path.join(DATA_DIR, 'feeds.db')
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_LIVE_ENTRIES = 1000
+COMPACT_BATCH = 500
+
+FEEDS = {
+    'social_posts': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        content TEXT,
+        timestamp TEXT
+    ''',
+    'notifications': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        message TEXT,
+        timestamp TEXT,
+        read INTEGER NOT NULL DEFAULT 0
+    '''
+}
+
+# Indexes, derived tables and later columns, appended in order; the
+# position of each step is its schema version (PRAGMA user_version), as
+# in db.MIGRATIONS
+SCHEMA_MIGRATIONS = [
+    # 1: notification inbox
+    [
+        'CREATE INDEX idx_notifications_inbox ON notifications (user_id, read, timestamp)',
+        'CREATE INDEX idx_notifications_user ON notifications (user_id, id)',
+        # Per-user unread counters, kept in step by triggers so every writer
+        # (append, mark-read, compact) updates them in its own transaction
+        'CREATE TABLE notification_counts (user_id TEXT PRIMARY KEY, unread INTEGER NOT NULL DEFAULT 0)',
+        '''CREATE TRIGGER notification_counts_insert AFTER INSERT ON notifications WHEN NEW.read = 0
+           BEGIN
+               INSERT INTO notification_counts (user_id, unread) VALUES (NEW.user_id, 1)
+               ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+           END''',
+        '''CREATE TRIGGER notification_counts_update AFTER UPDATE OF read ON notifications
+           WHEN (OLD.read = 0) != (NEW.read = 0)
+           BEGIN
+               INSERT INTO notification_counts (user_id, unread)
+               VALUES (NEW.user_id, CASE WHEN NEW.read = 0 THEN 1 ELSE 0 END)
+               ON CONFLICT (user_id) DO UPDATE
+               SET unread = unread + CASE WHEN NEW.read = 0 THEN 1 ELSE -1 END;
+           END''',
+        '''CREATE TRIGGER notification_counts_delete AFTER DELETE ON notifications WHEN OLD.read = 0
+           BEGIN
+               UPDATE notification_counts SET unread = unread - 1 WHERE user_id = OLD.user_id;
+           END''',
+        '''INSERT INTO notification_counts (user_id, unread)
+           SELECT user_id, COUNT(*) FROM notifications WHERE read = 0 GROUP BY user_id''',
+    ],
+    # 2: follow graph and per-user timelines (see services/social.py)
+    [
+        '''CREATE TABLE follows (
+               follower_id TEXT NOT NULL,
+               followee_id TEXT NOT NULL,
+               created_at TEXT,
+               PRIMARY KEY (follower_id, followee_id)
+           ) WITHOUT ROWID''',
+        'CREATE INDEX idx_follows_followee ON follows (followee_id, follower_id)',
+        # Post ids pushed to each follower's timeline (fan-out on write)
+        '''CREATE TABLE timelines (
+               user_id TEXT NOT NULL,
+               post_id INTEGER NOT NULL,
+               author_id TEXT NOT NULL,
+               PRIMARY KEY (user_id, post_id)
+           ) WITHOUT ROWID''',
+        # Posts that weren't pushed are pulled from their author on read
+        'ALTER TABLE social_posts ADD COLUMN fanned_out INTEGER NOT NULL DEFAULT 0',
+        'CREATE INDEX idx_social_posts_pull ON social_posts (user_id, fanned_out, id)',
+    ],
+    # 3: authors whose posts are pulled on read, and timeline entries by post
+    [
+        'CREATE TABLE pulled_authors (user_id TEXT PRIMARY KEY) WITHOUT ROWID',
+        'INSERT INTO pulled_authors (user_id) SELECT DISTINCT user_id FROM social_posts WHERE fanned_out = 0',
+        'CREATE INDEX idx_timelines_post ON timelines (post_id)',
+    ],
+]
+
+_local = threading.local()
+
+def _import_legacy_file(db, feed):
+    """Move entries from the old newest-first JSON array into the table."""
+    legacy_file = os.path.join(os.path.dirname(FEEDS_DB), f'{feed}.json')
+    if not os.path.exists(legacy_file):
+        return
+    # Several processes may start at once; the file lock lets one import it
+    with shared_files.locked(legacy_file):
+        if not os.path.exists(legacy_file):
+            return
+        if db.execute(f'SELECT 1 FROM {feed} LIMIT 1').fetchone() is None:
+            try:
+                with open(legacy_file, 'r') as f:
+                    entries = json.load(f)
+            except json.JSONDecodeError:
+                entries = []
+            with db:
+                for entry in reversed(entries):
+                    insert(db, feed, entry)
+        os.replace(legacy_file, legacy_file + '.migrated')
+
+def _migrate(db):
+    for version, statements in enumerate(SCHEMA_MIGRATIONS, start=1):
+        if db.execute('PRAGMA user_version').fetchone()[0] >= version:
+            continue
+        db.execute('BEGIN IMMEDIATE')
+        # Another process may have applied it while we waited
+        if db.execute('PRAGMA user_version').fetchone()[0] < version:
+            for statement in statements:
+                db.execute(statement)
+            db.execute(f'PRAGMA user_version = {version}')
+        db.commit()
+
+def connection():
+    """This thread's connection to the feeds database, for queries the helpers
+    here don't cover; `with connection():` is a transaction."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(FEEDS_DB)
+    if db is None:
+        os.makedirs(os.path.dirname(FEEDS_DB), exist_ok=True)
+        db = sqlite3.connect(FEEDS_DB, timeout=10)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        for feed, columns in FEEDS.items():
+            db.execute(f'CREATE TABLE IF NOT EXISTS {feed} ({columns})')
+        db.commit()
+        _migrate(db)
+        for feed in FEEDS:
+            _import_legacy_file(db, feed)
+        connections[FEEDS_DB] = db
+    return db
+
+def insert(db, feed, entry):
+    """Insert an entry in the caller's transaction and return its id."""
+    columns = [c for c in entry if c != 'id']
+    cursor = db.execute(
+        f'INSERT INTO {feed} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+        [entry[c] for c in columns]
+    )
+    return cursor.lastrowid
+
+def append(feed, entry):
+    """Append an entry (a dict of column values) and return its id."""
+    db = connection()
+    with db:
+        entry_id = insert(db, feed, entry)
+    data_version.bump()
+    return entry_id
+
+def tail(feed, limit=PAGE_SIZE, before_id=None):
+    """Return up to limit entries newest-first, optionally older than before_id."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    db = connection()
+    if before_id is None:
+        rows = db.execute(f'SELECT * FROM {feed} ORDER BY id DESC LIMIT ?', (limit,))
+    else:
+        rows = db.execute(
+            f'SELECT * FROM {feed} WHERE id < ? ORDER BY id DESC LIMIT ?',
+            (before_id, limit)
+        )
+    return [dict(row) for row in rows]
+
+def compact(feed, keep=MAX_LIVE_ENTRIES, where=None):
+    """Archive all but the newest keep entries of a feed. Returns how many moved.
+
+    where is an optional SQL condition limiting which old entries may be
+    archived (e.g. only notifications that have been read).
+    """
+    condition = f' AND ({where})' if where else ''
+    db = connection()
+    row = db.execute(
+        f'SELECT id FROM {feed} ORDER BY id DESC LIMIT 1 OFFSET ?', (keep - 1,)
+    ).fetchone()
+    if row is None:
+        return 0
+    cutoff = row['id']
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archive_file = os.path.join(ARCHIVE_DIR, f'{feed}.jsonl.gz')
+    moved = 0
+    # One compactor at a time per feed when several service replicas run
+    with shared_files.locked(archive_file):
+        while True:
+            rows = db.execute(
+                f'SELECT * FROM {feed} WHERE id < ?{condition} ORDER BY id LIMIT ?',
+                (cutoff, COMPACT_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            # Archive first, then delete, so a crash can only duplicate entries
+            with gzip.open(archive_file, 'at') as f:
+                for r in rows:
+                    f.write(json.dumps(dict(r)) + '\n')
+            with db:
+                db.execute(f'DELETE FROM {feed} WHERE id <= ? AND id < ?{condition}', (rows[-1]['id'], cutoff))
+            moved += len(rows)
+    return moved
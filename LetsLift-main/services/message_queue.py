@@ -0,0 +1,244 @@
+"""Durable local message queue shared by app.py and the services.
+
+Messages live in data/queue.db (SQLite, WAL mode), so several pending
+messages per service survive restarts instead of overwriting a single
+input file. Consumers claim a batch, process it and acknowledge it;
+claimed messages that are never acknowledged become visible again after
+VISIBILITY_TIMEOUT seconds. On POSIX systems producers ring a named pipe
+per service so an idle consumer wakes up immediately instead of polling.
+"""
+import json
+import logging
+import os
+import select
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'data')
+QUEUE_DB = os.path.join(DATA_DIR, 'queue.db')
+
+BATCH_SIZE = 50
+VISIBILITY_TIMEOUT = 30      # seconds before an unacked message is redelivered
+MAX_ATTEMPTS = 5             # deliveries before a failing message is dropped
+IDLE_TIMEOUT = 30            # max seconds a consumer blocks waiting for the doorbell
+POLL_INTERVAL = 0.25         # fallback polling interval when named pipes are unavailable
+
+logger = logging.getLogger(__name__)
+
+Message = namedtuple('Message', ['id', 'data', 'created_at', 'attempts'])
+
+_local = threading.local()
+
+def _connect():
+    """Return this thread's connection to the queue database."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(QUEUE_DB)
+    if db is None:
+        os.makedirs(os.path.dirname(QUEUE_DB), exist_ok=True)
+        db = sqlite3.connect(QUEUE_DB, timeout=10, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            claimed_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )''')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_messages_service ON messages (service, id)')
+        # Running totals written by consumers so other processes can report them
+        db.execute('''
+        CREATE TABLE IF NOT EXISTS consumer_stats (
+            service TEXT PRIMARY KEY,
+            processed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            lag_seconds_total REAL NOT NULL DEFAULT 0,
+            last_lag_seconds REAL NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL DEFAULT 0
+        )''')
+        connections[QUEUE_DB] = db
+    return db
+
+def _doorbell_path(service):
+    return os.path.join(os.path.dirname(QUEUE_DB), f'{service}.doorbell')
+
+def _ring(service):
+    """Wake up a consumer blocked on the service's doorbell, if any."""
+    if not hasattr(os, 'mkfifo'):
+        return
+    try:
+        fd = os.open(_doorbell_path(service), os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        # No doorbell yet or nobody listening; the message is still queued
+        return
+    try:
+        os.write(fd, b'\0')
+    except OSError:
+        # Pipe full: the consumer already has pending wake-ups
+        pass
+    finally:
+        os.close(fd)
+
+def publish(service, data):
+    """Queue a JSON-serializable message for a service."""
+    db = _connect()
+    db.execute(
+        'INSERT INTO messages (service, payload, created_at) VALUES (?, ?, ?)',
+        (service, json.dumps(data), time.time())
+    )
+    _ring(service)
+
+def claim(service, batch_size=BATCH_SIZE):
+    """Claim up to batch_size pending messages for a service, oldest first."""
+    db = _connect()
+    now = time.time()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        rows = db.execute(
+            'SELECT id, payload, created_at, attempts FROM messages '
+            'WHERE service = ? AND claimed_until < ? ORDER BY id LIMIT ?',
+            (service, now, batch_size)
+        ).fetchall()
+        db.executemany(
+            'UPDATE messages SET claimed_until = ?, attempts = attempts + 1 WHERE id = ?',
+            [(now + VISIBILITY_TIMEOUT, row[0]) for row in rows]
+        )
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+    return [Message(row[0], json.loads(row[1]), row[2], row[3] + 1) for row in rows]
+
+def ack(message_ids):
+    """Remove processed messages from the queue."""
+    if not message_ids:
+        return
+    db = _connect()
+    db.executemany('DELETE FROM messages WHERE id = ?', [(i,) for i in message_ids])
+
+def record_processed(service, lags, failed=0):
+    """Add a batch's processing lags (publish -> ack, in seconds) to the stats."""
+    if not lags and not failed:
+        return
+    db = _connect()
+    db.execute(
+        'INSERT INTO consumer_stats (service, processed, failed, lag_seconds_total, last_lag_seconds, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (service) DO UPDATE SET '
+        'processed = processed + excluded.processed, failed = failed + excluded.failed, '
+        'lag_seconds_total = lag_seconds_total + excluded.lag_seconds_total, '
+        'last_lag_seconds = CASE WHEN excluded.processed > 0 THEN excluded.last_lag_seconds ELSE last_lag_seconds END, '
+        'updated_at = excluded.updated_at',
+        (service, len(lags), failed, sum(lags), lags[-1] if lags else 0, time.time())
+    )
+
+def stats():
+    """Per-service queue depth, oldest pending age and consumer totals."""
+    db = _connect()
+    now = time.time()
+    result = {}
+    for service, pending, oldest in db.execute(
+            'SELECT service, COUNT(*), MIN(created_at) FROM messages GROUP BY service'):
+        result[service] = {'depth': pending, 'oldest_age_seconds': now - oldest}
+    for service, processed, failed, lag_total, last_lag in db.execute(
+            'SELECT service, processed, failed, lag_seconds_total, last_lag_seconds FROM consumer_stats'):
+        entry = result.setdefault(service, {'depth': 0, 'oldest_age_seconds': 0})
+        entry.update(processed=processed, failed=failed,
+                     lag_seconds_total=lag_total, last_lag_seconds=last_lag)
+    return result
+
+class Doorbell:
+    """Consumer side of a service's wake-up pipe (falls back to polling)."""
+
+    def __init__(self, service):
+        self.read_fd = None
+        self.keepalive_fd = None
+        if not hasattr(os, 'mkfifo'):
+            return
+        path = _doorbell_path(service)
+        try:
+            os.mkfifo(path)
+        except FileExistsError:
+            pass
+        self.read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Holding a writer open keeps select() from reporting EOF once producers close
+        self.keepalive_fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+
+    def wait(self, timeout):
+        """Block until rung or `timeout`; return whether it was rung.
+
+        When polling there is no bell, so this sleeps briefly and returns False.
+        """
+        if self.read_fd is None:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return False
+        ready, _, _ = select.select([self.read_fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        for fd in (self.read_fd, self.keepalive_fd):
+            if fd is not None:
+                os.close(fd)
+        self.read_fd = self.keepalive_fd = None
+
+def serve(service, handler, batch_size=BATCH_SIZE, on_idle=None):
+    """Process a service's messages forever, calling handler(data) for each.
+
+    Messages are acknowledged in batches once handled. A message whose
+    handler raises is redelivered after VISIBILITY_TIMEOUT and dropped
+    after MAX_ATTEMPTS deliveries. on_idle, if given, is called when a wait
+    ends without the doorbell ringing, at most once every IDLE_TIMEOUT, so
+    it never delays a message that has just arrived.
+    """
+    os.makedirs(os.path.dirname(QUEUE_DB), exist_ok=True)
+    doorbell = Doorbell(service)
+    last_idle = time.monotonic()
+    try:
+        while True:
+            messages = []
+            try:
+                messages = claim(service, batch_size)
+                done = []
+                lags = []
+                failed = 0
+                for message in messages:
+                    try:
+                        handler(message.data)
+                        done.append(message.id)
+                        lags.append(time.time() - message.created_at)
+                    except Exception as e:
+                        failed += 1
+                        logger.warning("%s service: message %s failed (attempt %s): %s",
+                                       service, message.id, message.attempts, e)
+                        if message.attempts >= MAX_ATTEMPTS:
+                            logger.error("%s service: dropping message %s", service, message.id)
+                            done.append(message.id)
+                ack(done)
+                record_processed(service, lags, failed)
+            except Exception as e:
+                logger.error("%s service: queue error: %s", service, e)
+                time.sleep(POLL_INTERVAL)
+            if not messages:
+                rung = doorbell.wait(IDLE_TIMEOUT)
+                if on_idle is not None and not rung and time.monotonic() - last_idle >= IDLE_TIMEOUT:
+                    last_idle = time.monotonic()
+                    try:
+                        on_idle()
+                    except Exception as e:
+                        logger.error("%s service: idle task failed: %s", service, e)
+    finally:
+        doorbell.close()
@@ -1,17 +1,14 @@
-import json
-import time
+import logging
 import os
 from datetime import datetime
+import data_version
+from logs import setup_logging
+from services import feed_store, message_queue
+
+logger = logging.getLogger(__name__)
 
 def create_notification(data):
     try:
-        notifications_file = 'data/notifications.json'
-        if os.path.exists(notifications_file):
-            with open(notifications_file, 'r') as f:
-                notifications = json.load(f)
-        else:
-            notifications = []
-        
         new_notification = {
             "user_id": data.get('user_id', 'default_user'),
             "message": "Workout completed! 💪",
@@ -19,33 +16,75 @@ def create_notification(data):
             "read": False
         }
         
-        notifications.insert(0, new_notification)
-        
-        with open(notifications_file, 'w') as f:
-            json.dump(notifications, f, indent=2)
+        feed_store.append('notifications', new_notification)
             
-        print(f"Notification Service: Created notification for {new_notification['user_id']}")
+        logger.info("Created notification for %s", new_notification['user_id'])
         
     except Exception as e:
-        print(f"Notification Service Error: {e}")
+        logger.error("Notification Service Error: %s", e)
+        raise
+
+def get_recent_notifications(user_id, limit=feed_store.PAGE_SIZE, before_id=None, unread_only=False):
+    """A page of a user's inbox, newest first; before_id is the last id of the previous page."""
+    limit = max(1, min(limit, feed_store.MAX_PAGE_SIZE))
+    conditions = ['user_id = ?']
+    params = [user_id]
+    if unread_only:
+        # Served by idx_notifications_inbox (user_id, read, timestamp)
+        conditions.append('read = 0')
+    if before_id is not None:
+        conditions.append('id < ?')
+        params.append(before_id)
+    order = 'timestamp DESC, id DESC' if unread_only else 'id DESC'
+    rows = feed_store.connection().execute(
+        f'SELECT * FROM notifications WHERE {" AND ".join(conditions)} ORDER BY {order} LIMIT ?',
+        params + [limit]
+    )
+    return [dict(row) for row in rows]
+
+def get_unread_count(user_id):
+    row = feed_store.connection().execute(
+        'SELECT unread FROM notification_counts WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row['unread'] if row else 0
+
+def mark_read(user_id, notification_ids):
+    """Mark some of a user's notifications read. Returns how many changed."""
+    notification_ids = list(notification_ids)
+    if not notification_ids:
+        return 0
+    db = feed_store.connection()
+    with db:
+        changed = db.execute(
+            f'UPDATE notifications SET read = 1 WHERE user_id = ? AND read = 0 '
+            f'AND id IN ({", ".join("?" * len(notification_ids))})',
+            [user_id] + notification_ids
+        ).rowcount
+    if changed:
+        data_version.bump()
+    return changed
+
+def mark_all_read(user_id):
+    db = feed_store.connection()
+    with db:
+        changed = db.execute(
+            'UPDATE notifications SET read = 1 WHERE user_id = ? AND read = 0', (user_id,)
+        ).rowcount
+    if changed:
+        data_version.bump()
+    return changed
+
+def compact_notifications():
+    # Unread notifications stay in the inbox however old they are
+    moved = feed_store.compact('notifications', where='read = 1')
+    if moved:
+        logger.info("Archived %s old notifications", moved)
 
 def run_notification_service():
-    print("Notification Service: Running...")
+    setup_logging()
+    logger.info("Notification Service: Running...")
     os.makedirs('data', exist_ok=True)
-    
-    while True:
-        try:
-            if os.path.exists('data/notification_input.txt'):
-                with open('data/notification_input.txt', 'r') as f:
-                    data = json.load(f)
-                
-                create_notification(data)
-                os.remove('data/notification_input.txt')
-                
-        except Exception as e:
-            print(f"Notification Service Error: {e}")
-            
-        time.sleep(1)
+    message_queue.serve('notification', create_notification, on_idle=compact_notifications)
 
 if __name__ == "__main__":
     run_notification_service() 
\ No newline at end of file
@@ -1,125 +1,259 @@
 import json
-import time
+import logging
 import os
 from datetime import datetime, timedelta
 from collections import Counter
+from urllib.parse import quote, unquote
+import data_version
+import shared_files
+from db import connect, migrate
+from logs import setup_logging
+from services import message_queue
+
+logger = logging.getLogger(__name__)
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'data')
+DB_PATH = os.path.join(os.path.dirname(SCRIPT_DIR), 'workouts.db')
 
-def calculate_stats(workout_data):
-    print("\n=== Processing Progress Stats ===")
-    print(f"Received data: {json.dumps(workout_data, indent=2)}")
-    
+DEFAULT_USER = 'default_user'
+STATE_SUFFIX = '_state.json'
+OUTPUT_SUFFIX = '_output.txt'
+
+# Longest time window reported; older start times are dropped from the state
+WINDOW_DAYS = {'week': 7, 'two_weeks': 14, 'month': 30}
+RECENT_DAYS = max(WINDOW_DAYS.values())
+# Workouts can arrive out of id order (several app workers, the event
+# pool), so ids counted above last_workout_id are remembered individually
+# up to this many before the oldest are folded into it
+MAX_APPLIED_IDS = 1000
+
+def new_state():
+    return {
+        'last_workout_id': 0,
+        'applied_ids': [],
+        'total_workouts': 0,
+        'total_volume': 0,
+        'exercise_counts': {},
+        'recent_start_times': []
+    }
+
+def user_dir():
+    return os.path.join(DATA_DIR, 'progress')
+
+def user_file(user_id, suffix):
+    # Every user has their own state and output; quoting keeps any id a plain file name
+    return os.path.join(user_dir(), quote(user_id, safe='') + suffix)
+
+def state_file(user_id=DEFAULT_USER):
+    return user_file(user_id, STATE_SUFFIX)
+
+def load_state(user_id=DEFAULT_USER):
+    try:
+        with open(state_file(user_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_state(user_id, state):
+    shared_files.atomic_write(state_file(user_id), json.dumps(state))
+
+def get_stats(user_id=DEFAULT_USER):
+    """The user's stats as last written by the service ({} before the first)."""
+    try:
+        with open(user_file(user_id, OUTPUT_SUFFIX), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error("Error reading progress stats for %s: %s", user_id, e)
+        return {}
+
+def exercise_volume(exercise):
+    try:
+        return float(exercise['weight']) * exercise['sets'] * exercise['reps']
+    except (ValueError, TypeError):
+        # Bodyweight and other non-numeric entries don't count towards volume
+        return 0
+
+def apply_workout(state, workout, now=None):
+    """Fold one saved workout into the running aggregates."""
+    workout_id = workout.get('id')
+    if workout_id is not None:
+        applied = state.setdefault('applied_ids', [])
+        if workout_id <= state['last_workout_id'] or workout_id in applied:
+            # Redelivered message, already counted
+            return False
+        applied.append(workout_id)
+        if len(applied) > MAX_APPLIED_IDS:
+            applied.sort()
+            half = len(applied) // 2
+            state['last_workout_id'] = applied[half - 1]
+            del applied[:half]
+
+    state['total_workouts'] += 1
+    counts = state['exercise_counts']
+    for exercise in workout.get('exercises', []):
+        counts[exercise['name']] = counts.get(exercise['name'], 0) + 1
+        state['total_volume'] += exercise_volume(exercise)
+
+    cutoff = ((now or datetime.now()) - timedelta(days=RECENT_DAYS)).strftime("%Y-%m-%d %H:%M")
+    if workout['start_time'] >= cutoff:
+        state['recent_start_times'].append(workout['start_time'])
+    return True
+
+def prune_state(state, now=None):
+    cutoff = ((now or datetime.now()) - timedelta(days=RECENT_DAYS)).strftime("%Y-%m-%d %H:%M")
+    state['recent_start_times'] = [t for t in state['recent_start_times'] if t >= cutoff]
+
+def _rebuild(db_path, user_id=None):
+    """{user_id: state} recomputed from workouts.db in a single pass (every user by default)."""
+    db_path = db_path or DB_PATH
+    states = {}
+    if not os.path.exists(db_path):
+        return states
+    user_filter = '' if user_id is None else 'WHERE w.user_id = ?'
+    params = () if user_id is None else (user_id,)
+    db = connect(db_path)
     try:
-        # Load workout history
-        workouts = workout_data.get('workouts', [])
-        print(f"Processing {len(workouts)} workouts")
-        
-        if not workouts:
-            print("No workouts found in data!")
-            return {}
-            
-        stats = {
-            'total_workouts': len(workouts),
-            'time_periods': {
-                'week': 0,
-                'two_weeks': 0,
-                'month': 0
-            },
-            'exercise_frequency': {
-                'top_exercises': []
-            },
-            'total_volume': 0
-        }
-        
-        print("Calculating time-based stats...")
-        now = datetime.now()
-        week_ago = now - timedelta(days=7)
-        two_weeks_ago = now - timedelta(days=14)
-        month_ago = now - timedelta(days=30)
-        
-        all_exercises = []
-        
-        for workout in workouts:
-            try:
-                workout_time = datetime.strptime(workout['start_time'], "%Y-%m-%d %H:%M")
-                print(f"Processing workout from {workout_time}")
-                
-                if workout_time >= week_ago:
-                    stats['time_periods']['week'] += 1
-                if workout_time >= two_weeks_ago:
-                    stats['time_periods']['two_weeks'] += 1
-                if workout_time >= month_ago:
-                    stats['time_periods']['month'] += 1
-                
-                for exercise in workout.get('exercises', []):
-                    all_exercises.append(exercise['name'])
-                    try:
-                        weight = float(exercise['weight'])
-                        volume = weight * exercise['sets'] * exercise['reps']
-                        stats['total_volume'] += volume
-                        print(f"Added volume for {exercise['name']}: {volume}")
-                    except (ValueError, TypeError):
-                        print(f"Skipping volume calculation for {exercise['name']}")
-            except Exception as e:
-                print(f"Error processing workout: {e}")
-                continue
-        
-        print("\nCalculating exercise frequency...")
-        exercise_counter = Counter(all_exercises)
-        top_exercises = exercise_counter.most_common(3)
-        stats['exercise_frequency']['top_exercises'] = [
-            {'name': name, 'count': count}
-            for name, count in top_exercises
-        ]
-        
-        print("\n=== Final Stats ===")
-        print(json.dumps(stats, indent=2))
-        
-        print("\nWriting to output file...")
-        output_file = os.path.join(DATA_DIR, 'progress_output.txt')
-        with open(output_file, 'w') as f:
-            json.dump(stats, f, indent=2)
-        print("Stats written successfully!")
-        
-        return stats
-        
-    except Exception as e:
-        print(f"Error calculating stats: {e}")
-        import traceback
-        print(traceback.format_exc())
+        migrate(db)
+        state = None
+        workout = None
+        workout_id = None
+        rows = db.execute(
+            'SELECT w.user_id, w.id, w.start_time, e.name, e.weight_lbs, e.sets, e.reps '
+            f'FROM workouts w LEFT JOIN exercises e ON e.workout_id = w.id {user_filter} '
+            'ORDER BY w.user_id, w.id, e.id',
+            params
+        )
+        for row_user, row_id, start_time, name, weight, sets, reps in rows:
+            if workout is None or workout_id != row_id:
+                if workout is not None:
+                    apply_workout(state, workout)
+                    # Everything up to here is counted
+                    state['last_workout_id'] = workout_id
+                state = states.setdefault(row_user, new_state())
+                workout_id = row_id
+                workout = {'start_time': start_time, 'exercises': []}
+            if name is not None:
+                workout['exercises'].append({'name': name, 'weight': weight, 'sets': sets, 'reps': reps})
+        if workout is not None:
+            apply_workout(state, workout)
+            state['last_workout_id'] = workout_id
+    finally:
+        db.close()
+    return states
+
+def rebuild_state(user_id=DEFAULT_USER, db_path=None):
+    """Recompute one user's aggregates from workouts.db in a single pass."""
+    return _rebuild(db_path, user_id).get(user_id) or new_state()
+
+def rebuild_all(db_path=None):
+    """Recompute and write every user's state and stats."""
+    states = _rebuild(db_path)
+    os.makedirs(user_dir(), exist_ok=True)
+    for user_id, state in states.items():
+        with shared_files.locked(state_file(user_id)):
+            save_state(user_id, state)
+            write_stats(user_id, state)
+    return len(states)
+
+def build_stats(state, now=None):
+    """Turn the running aggregates into the stats shown on the history page."""
+    if not state['total_workouts']:
         return {}
 
+    now = now or datetime.now()
+    time_periods = {}
+    for period, days in WINDOW_DAYS.items():
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M")
+        time_periods[period] = sum(1 for t in state['recent_start_times'] if t >= cutoff)
+
+    top_exercises = Counter(state['exercise_counts']).most_common(3)
+    return {
+        'total_workouts': state['total_workouts'],
+        'time_periods': time_periods,
+        'exercise_frequency': {
+            'top_exercises': [
+                {'name': name, 'count': count}
+                for name, count in top_exercises
+            ]
+        },
+        'total_volume': state['total_volume']
+    }
+
+def write_stats(user_id, state):
+    stats = build_stats(state)
+    output_file = user_file(user_id, OUTPUT_SUFFIX)
+    text = json.dumps(stats, indent=2)
+    try:
+        with open(output_file, 'r') as f:
+            unchanged = f.read() == text
+    except FileNotFoundError:
+        unchanged = False
+    # refresh_stats() rewrites this every idle pass; only a real change
+    # should invalidate cached pages
+    if not unchanged:
+        # The app reads this file while we write it
+        shared_files.atomic_write(output_file, text)
+        data_version.bump()
+    return stats
+
+def calculate_stats(workout_data):
+    """Apply a newly saved workout to its user's aggregates and refresh their output.
+
+    Cost depends on the size of the new workout, not on the history. The
+    user's state file is locked for the update, so replicas of the service
+    can share it.
+    """
+    user_id = workout_data.get('user_id', DEFAULT_USER)
+    os.makedirs(user_dir(), exist_ok=True)
+    with shared_files.locked(state_file(user_id)):
+        state = load_state(user_id)
+        if state is None or workout_data.get('rebuild'):
+            # Sent after a bulk import of history
+            state = rebuild_state(user_id)
+
+        workout = workout_data.get('workout')
+        if workout and apply_workout(state, workout):
+            logger.debug("Added workout %s from %s", workout.get('id'), workout['start_time'])
+        prune_state(state)
+        save_state(user_id, state)
+
+        stats = write_stats(user_id, state)
+    logger.info("Stats updated for %s: %s workouts, %s lbs total volume",
+                user_id, stats.get('total_workouts', 0), stats.get('total_volume', 0))
+    return stats
+
+def refresh_stats():
+    """Re-roll every user's time windows while idle so they don't go stale."""
+    try:
+        names = os.listdir(user_dir())
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(STATE_SUFFIX):
+            continue
+        user_id = unquote(name[:-len(STATE_SUFFIX)])
+        with shared_files.locked(state_file(user_id)):
+            state = load_state(user_id)
+            if state is not None:
+                prune_state(state)
+                write_stats(user_id, state)
+
 def run_progress_service():
-    print("\n=== Progress Service Starting ===")
-    print(f"Current directory: {os.getcwd()}")
-    print(f"Looking for data in: {os.path.abspath(DATA_DIR)}")
-    
-    os.makedirs(DATA_DIR, exist_ok=True)
-    print("Data directory ensured")
-    
-    print("Progress Service: Running and waiting for input...")
-    print("Press Ctrl+C to stop\n")
-    
-    while True:
-        try:
-            input_file = os.path.join(DATA_DIR, 'progress_input.txt')
-            if os.path.exists(input_file):
-                print("\nFound new input file!")
-                with open(input_file, 'r') as f:
-                    data = json.load(f)
-                
-                calculate_stats(data)
-                os.remove(input_file)
-                print("Processed and removed input file")
-                
-        except Exception as e:
-            print(f"Progress Service Error: {e}")
-            import traceback
-            print(traceback.format_exc())
-            
-        time.sleep(1)
+    setup_logging()
+    logger.info("Progress Service starting, data in %s", os.path.abspath(DATA_DIR))
+    os.makedirs(user_dir(), exist_ok=True)
+
+    with shared_files.locked(user_dir()):
+        if not any(name.endswith(STATE_SUFFIX) for name in os.listdir(user_dir())):
+            logger.info("No saved aggregates, rebuilding from workouts.db...")
+            logger.info("Rebuilt progress stats for %s users", rebuild_all())
+
+    logger.info("Progress Service: Running and waiting for input...")
+
+    message_queue.serve('progress', calculate_stats, on_idle=refresh_stats)
 
 if __name__ == "__main__":
-    run_progress_service() 
\ No newline at end of file
+    run_progress_service()
@@ -1,53 +1,215 @@
-import json
-import time
+import heapq
+import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+import data_version
+from logs import setup_logging
+from services import feed_store, message_queue
+
+logger = logging.getLogger(__name__)
+
+# Timelines are hybrid (tables in data/feeds.db, see feed_store.SCHEMA_MIGRATIONS):
+#   - a post by someone with at most FANOUT_LIMIT followers is pushed into
+#     each follower's `timelines` rows (and the author's own) when written
+#   - a post by anyone with more followers is left in place with
+#     fanned_out = 0, its author is added to `pulled_authors`, and it is
+#     pulled from the author when a timeline is read
+# Reading a timeline is then one range read of the user's own rows plus one
+# bounded index seek per followed pulled author, however many people the
+# user follows and however many posts there are. Posts stay live while a
+# timeline can show them (see compact_posts).
+FANOUT_LIMIT = 1000
+TIMELINE_LENGTH = 500           # pushed entries kept per user by trim_timelines()
+MAX_CACHED_TIMELINES = 256      # first pages kept in memory, least recently used evicted
+
+_cache_lock = threading.Lock()
+_timeline_cache = OrderedDict()
 
 def process_social_post(data):
     try:
-        # Load existing posts
-        posts_file = 'data/social_posts.json'
-        if os.path.exists(posts_file):
-            with open(posts_file, 'r') as f:
-                posts = json.load(f)
-        else:
-            posts = []
-        
-        # Add new post
         new_post = {
             "user_id": data.get('user_id', 'default_user'),
             "content": data.get('content', ''),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M")
         }
-        
-        posts.insert(0, new_post)
-        
-        # Save updated posts
-        with open(posts_file, 'w') as f:
-            json.dump(posts, f, indent=2)
-            
-        print(f"Social Service: Added new post - {new_post['content']}")
-        
+
+        db = feed_store.connection()
+        with db:
+            post_id = feed_store.insert(db, 'social_posts', new_post)
+            pushed = fan_out(db, post_id, new_post['user_id'])
+        data_version.bump()
+
+        logger.info("Added new post - %s (%s)", new_post['content'],
+                    f"pushed to {pushed} timelines" if pushed else "pulled on read")
+
     except Exception as e:
-        print(f"Social Service Error: {e}")
+        logger.error("Social Service Error: %s", e)
+        raise
+
+def fan_out(db, post_id, author_id):
+    """Push a new post to its author's followers unless there are too many.
+
+    Returns the number of timelines written; 0 means the post is read on
+    demand instead. Runs in the caller's transaction.
+    """
+    followers = db.execute(
+        'SELECT COUNT(*) FROM (SELECT 1 FROM follows WHERE followee_id = ? LIMIT ?)',
+        (author_id, FANOUT_LIMIT + 1)
+    ).fetchone()[0]
+    if followers > FANOUT_LIMIT:
+        db.execute('INSERT OR IGNORE INTO pulled_authors (user_id) VALUES (?)', (author_id,))
+        return 0
+    db.execute(
+        'INSERT OR IGNORE INTO timelines (user_id, post_id, author_id) '
+        'SELECT follower_id, ?, ? FROM follows WHERE followee_id = ? '
+        'UNION ALL SELECT ?, ?, ?',
+        (post_id, author_id, author_id, author_id, post_id, author_id)
+    )
+    db.execute('UPDATE social_posts SET fanned_out = 1 WHERE id = ?', (post_id,))
+    return followers + 1
+
+def follow(follower_id, followee_id):
+    """Start following someone; their recent pushed posts are copied in."""
+    if follower_id == followee_id:
+        return False
+    db = feed_store.connection()
+    with db:
+        added = db.execute(
+            'INSERT OR IGNORE INTO follows (follower_id, followee_id, created_at) VALUES (?, ?, ?)',
+            (follower_id, followee_id, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        ).rowcount
+        if added:
+            db.execute(
+                'INSERT OR IGNORE INTO timelines (user_id, post_id, author_id) '
+                'SELECT ?, post_id, author_id FROM timelines WHERE user_id = ? AND author_id = ? '
+                'ORDER BY post_id DESC LIMIT ?',
+                (follower_id, followee_id, followee_id, TIMELINE_LENGTH)
+            )
+    if added:
+        data_version.bump()
+    return bool(added)
+
+def unfollow(follower_id, followee_id):
+    db = feed_store.connection()
+    with db:
+        removed = db.execute(
+            'DELETE FROM follows WHERE follower_id = ? AND followee_id = ?', (follower_id, followee_id)
+        ).rowcount
+        if removed:
+            db.execute(
+                'DELETE FROM timelines WHERE user_id = ? AND author_id = ?', (follower_id, followee_id)
+            )
+    if removed:
+        data_version.bump()
+    return bool(removed)
+
+def get_following(user_id):
+    rows = feed_store.connection().execute(
+        'SELECT followee_id FROM follows WHERE follower_id = ? ORDER BY followee_id', (user_id,)
+    )
+    return [row['followee_id'] for row in rows]
+
+def _read_timeline(user_id, limit, before_id):
+    db = feed_store.connection()
+    before_id = before_id if before_id is not None else 2 ** 63 - 1
+    sources = [db.execute(
+        'SELECT p.* FROM timelines t JOIN social_posts p ON p.id = t.post_id '
+        'WHERE t.user_id = ? AND t.post_id < ? ORDER BY t.post_id DESC LIMIT ?',
+        (user_id, before_id, limit)
+    ).fetchall()]
+    # Driven from the reader's follows, so this never scans pulled_authors
+    pulled = db.execute(
+        'SELECT f.followee_id FROM follows f JOIN pulled_authors a ON a.user_id = f.followee_id '
+        'WHERE f.follower_id = ? '
+        'UNION SELECT user_id FROM pulled_authors WHERE user_id = ?',
+        (user_id, user_id)
+    ).fetchall()
+    for (author_id,) in pulled:
+        sources.append(db.execute(
+            'SELECT * FROM social_posts WHERE user_id = ? AND fanned_out = 0 AND id < ? '
+            'ORDER BY id DESC LIMIT ?',
+            (author_id, before_id, limit)
+        ).fetchall())
+
+    posts = []
+    last_id = None
+    for row in heapq.merge(*sources, key=lambda row: -row['id']):
+        if row['id'] != last_id:
+            posts.append(dict(row))
+            last_id = row['id']
+            if len(posts) == limit:
+                break
+    return posts
+
+def get_timeline(user_id, limit=feed_store.PAGE_SIZE, before_id=None):
+    """A page of the user's timeline (own and followed posts), newest first.
+
+    The first page is cached in memory and revalidated against the data
+    version, which every feed write bumps.
+    """
+    limit = max(1, min(limit, feed_store.MAX_PAGE_SIZE))
+    if before_id is not None:
+        return _read_timeline(user_id, limit, before_id)
+
+    version, _ = data_version.current()
+    key = (user_id, limit)
+    with _cache_lock:
+        entry = _timeline_cache.get(key)
+        if entry is not None and entry[0] == version:
+            _timeline_cache.move_to_end(key)
+            return list(entry[1])
+
+    posts = _read_timeline(user_id, limit, None)
+    with _cache_lock:
+        _timeline_cache[key] = (version, posts)
+        _timeline_cache.move_to_end(key)
+        while len(_timeline_cache) > MAX_CACHED_TIMELINES:
+            _timeline_cache.popitem(last=False)
+    return list(posts)
+
+def get_recent_posts(limit=feed_store.PAGE_SIZE, before_id=None):
+    """Every user's posts, newest first."""
+    return feed_store.tail('social_posts', limit, before_id)
+
+def trim_timelines(length=TIMELINE_LENGTH):
+    """Drop pushed entries beyond the newest `length` per user."""
+    db = feed_store.connection()
+    with db:
+        # Counting walks the primary key; only overfull timelines get ranked
+        removed = db.execute(
+            'DELETE FROM timelines WHERE (user_id, post_id) IN ('
+            '  SELECT user_id, post_id FROM ('
+            '    SELECT user_id, post_id, '
+            '           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY post_id DESC) AS position '
+            '    FROM timelines WHERE user_id IN ('
+            '      SELECT user_id FROM timelines GROUP BY user_id HAVING COUNT(*) > ?)) '
+            '  WHERE position > ?)',
+            (length, length)
+        ).rowcount
+    return removed
+
+def compact_posts():
+    trimmed = trim_timelines()
+    if trimmed:
+        logger.info("Trimmed %s timeline entries", trimmed)
+    # Only posts no timeline can show any more: pushed posts trimmed from
+    # every timeline, and pulled posts beyond their author's newest
+    # TIMELINE_LENGTH
+    moved = feed_store.compact('social_posts', where=(
+        'CASE WHEN fanned_out = 1 '
+        'THEN NOT EXISTS (SELECT 1 FROM timelines WHERE post_id = social_posts.id) '
+        'ELSE id < (SELECT p.id FROM social_posts p WHERE p.user_id = social_posts.user_id '
+        f'          AND p.fanned_out = 0 ORDER BY p.id DESC LIMIT 1 OFFSET {TIMELINE_LENGTH - 1}) END'))
+    if moved:
+        logger.info("Archived %s old posts", moved)
 
 def run_social_service():
-    print("Social Service: Running...")
+    setup_logging()
+    logger.info("Social Service: Running...")
     os.makedirs('data', exist_ok=True)
-    
-    while True:
-        try:
-            if os.path.exists('data/social_input.txt'):
-                with open('data/social_input.txt', 'r') as f:
-                    data = json.load(f)
-                
-                process_social_post(data)
-                os.remove('data/social_input.txt')
-                
-        except Exception as e:
-            print(f"Social Service Error: {e}")
-            
-        time.sleep(1)
+    message_queue.serve('social', process_social_post, on_idle=compact_posts)
 
 if __name__ == "__main__":
-    run_social_service() 
\ No newline at end of file
+    run_social_service()
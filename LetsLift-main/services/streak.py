@@ -1,64 +1,176 @@
-import time
-from datetime import datetime
-import os
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+import data_version
+from db import get_db, init_db
+from leaderboards import record_streak
+from logs import setup_logging
+from services import message_queue
 
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'data')
+logger = logging.getLogger(__name__)
 
-def read_stored_date():
-    try:
-        with open(os.path.join(DATA_DIR, 'stored_date.txt'), 'r') as file:
-            return datetime.strptime(file.read().strip(), '%m-%d-%Y').date()
-    except (FileNotFoundError, ValueError):
-        return None
+DEFAULT_USER = 'default_user'
 
-def save_stored_date(date):
-    with open(os.path.join(DATA_DIR, 'stored_date.txt'), 'w') as file:
-        file.write(date.strftime('%m-%d-%Y'))
+# Streak state lives in workouts.db (see db._add_streak_tables):
+#   workout_days   - the distinct days each user trained
+#   streak_runs    - maximal runs of consecutive days, keyed by start and end
+#   streak_summary - the latest run and the longest run length per user
+# Inserting a day only touches the runs on either side of it, so dates can
+# arrive in any order and the state survives restarts.
+
+def _shift(day, days):
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+def _run_length(start, end):
+    return (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+
+def add_workout_day(db, user_id, day):
+    """Record a training day ('YYYY-MM-DD') and merge it into the user's runs.
+
+    Returns False if the day was already recorded. The caller commits.
+    """
+    inserted = db.execute(
+        'INSERT OR IGNORE INTO workout_days (user_id, day) VALUES (?, ?)', (user_id, day)
+    ).rowcount
+    if not inserted:
+        return False
+
+    start, end = day, day
+    before = db.execute(
+        'SELECT start_day FROM streak_runs WHERE user_id = ? AND end_day = ?',
+        (user_id, _shift(day, -1))
+    ).fetchone()
+    if before:
+        start = before['start_day']
+        db.execute('DELETE FROM streak_runs WHERE user_id = ? AND start_day = ?', (user_id, start))
+    after = db.execute(
+        'SELECT end_day FROM streak_runs WHERE user_id = ? AND start_day = ?',
+        (user_id, _shift(day, 1))
+    ).fetchone()
+    if after:
+        end = after['end_day']
+        db.execute('DELETE FROM streak_runs WHERE user_id = ? AND start_day = ?', (user_id, _shift(day, 1)))
+
+    length = _run_length(start, end)
+    db.execute(
+        'INSERT INTO streak_runs (user_id, start_day, end_day, length) VALUES (?, ?, ?, ?)',
+        (user_id, start, end, length)
+    )
+    # Every day from here to the end of the run now has a longer streak behind it
+    record_streak(db, user_id, start, day, end)
+
+    summary = db.execute(
+        'SELECT last_end, longest FROM streak_summary WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    if summary is None:
+        db.execute(
+            'INSERT INTO streak_summary (user_id, last_start, last_end, longest) VALUES (?, ?, ?, ?)',
+            (user_id, start, end, length)
+        )
+    else:
+        if end >= summary['last_end']:
+            db.execute(
+                'UPDATE streak_summary SET last_start = ?, last_end = ? WHERE user_id = ?',
+                (start, end, user_id)
+            )
+        if length > summary['longest']:
+            db.execute('UPDATE streak_summary SET longest = ? WHERE user_id = ?', (length, user_id))
+    return True
+
+def get_streak(user_id=DEFAULT_USER, today=None):
+    """Current and longest streak in days for a user.
+
+    The current streak is the latest run of consecutive training days, as
+    long as it reaches today or yesterday; otherwise it has lapsed to 0.
+    """
+    with get_db() as db:
+        row = db.execute(
+            'SELECT last_start, last_end, longest FROM streak_summary WHERE user_id = ?', (user_id,)
+        ).fetchone()
+    if row is None:
+        return {'current': 0, 'longest': 0}
+    yesterday = ((today or date.today()) - timedelta(days=1)).isoformat()
+    current = _run_length(row['last_start'], row['last_end']) if row['last_end'] >= yesterday else 0
+    return {'current': current, 'longest': row['longest']}
+
+def rebuild_streaks(user_id=None):
+    """Recompute the streak tables from workouts.db in one pass (all users by default)."""
+    user_filter = '' if user_id is None else 'AND user_id = ?'
+    params = () if user_id is None else (user_id,)
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        for table in ('workout_days', 'streak_runs', 'streak_summary'):
+            if user_id is None:
+                db.execute(f'DELETE FROM {table}')
+            else:
+                db.execute(f'DELETE FROM {table} WHERE user_id = ?', params)
+
+        days = db.execute(
+            'SELECT DISTINCT user_id, substr(started_at, 1, 10) FROM workouts '
+            f'WHERE started_at IS NOT NULL {user_filter} ORDER BY 1, 2',
+            params
+        ).fetchall()
+        runs = []
+        for user_id, day in days:
+            if runs and runs[-1][0] == user_id and runs[-1][2] == _shift(day, -1):
+                runs[-1][2] = day
+            else:
+                runs.append([user_id, day, day])
+
+        db.executemany('INSERT INTO workout_days (user_id, day) VALUES (?, ?)', days)
+        db.executemany(
+            'INSERT INTO streak_runs (user_id, start_day, end_day, length) VALUES (?, ?, ?, ?)',
+            [(user_id, start, end, _run_length(start, end)) for user_id, start, end in runs]
+        )
+        summaries = {}
+        for user_id, start, end in runs:
+            longest = max(summaries.get(user_id, (0,))[0], _run_length(start, end))
+            # Runs are sorted per user, so the last one seen is the latest
+            summaries[user_id] = (longest, start, end)
+        db.executemany(
+            'INSERT INTO streak_summary (user_id, last_start, last_end, longest) VALUES (?, ?, ?, ?)',
+            [(user_id, start, end, longest) for user_id, (longest, start, end) in summaries.items()]
+        )
+        db.commit()
+    data_version.bump()
+    logger.info("Rebuilt streaks from %s workout days", len(days))
+
+def update_streak(data):
+    new_date = datetime.strptime(data['date'], '%m-%d-%Y').date()
+    user_id = data.get('user_id', DEFAULT_USER)
+    logger.debug("Processing workout date: %s", new_date)
+
+    with get_db() as db:
+        db.execute('BEGIN IMMEDIATE')
+        added = add_workout_day(db, user_id, new_date.isoformat())
+        db.commit()
+
+    if added:
+        data_version.bump()
+    else:
+        logger.debug("Day already recorded, maintaining streak")
+    streak = get_streak(user_id)
+    logger.info("Current streak for %s: %s days (longest %s)", user_id, streak['current'], streak['longest'])
 
 def run_streak_service():
-    print("Streak Service: Running...")
-    os.makedirs(DATA_DIR, exist_ok=True)
-    stored_date = read_stored_date()
-    current_streak = 0
-
-    while True:
-        try:
-            workout_date_file = os.path.join(DATA_DIR, 'workout_date.txt')
-            if os.path.exists(workout_date_file):
-                with open(workout_date_file, 'r') as f:
-                    date_str = f.read().strip()
-                    new_date = datetime.strptime(date_str, '%m-%d-%Y').date()
-                
-                print(f"Processing workout date: {new_date}")
-                
-                if stored_date:
-                    date_diff = (new_date - stored_date).days
-                    if date_diff == 1:  # Next day
-                        current_streak += 1
-                        print(f"Streak increased to {current_streak}")
-                    elif date_diff == 0:  # Same day
-                        print("Same day, maintaining streak")
-                    else:  # Streak broken
-                        current_streak = 1
-                        print("Streak reset to 1")
-                else:
-                    current_streak = 1
-                    print("First workout, streak set to 1")
-                
-                stored_date = new_date
-                save_stored_date(stored_date)
-                
-                # Write streak to file that app.py will read
-                with open(os.path.join(DATA_DIR, 'streak.txt'), 'w') as f:
-                    f.write(str(current_streak))
-                
-                print(f"Current streak: {current_streak} days")
-                os.remove(workout_date_file)
-                
-        except Exception as e:
-            print(f"Streak Service Error: {e}")
-        time.sleep(1)
+    logger.info("Streak Service: Running...")
+    init_db()
+    with get_db() as db:
+        needs_rebuild = (db.execute('SELECT 1 FROM workout_days LIMIT 1').fetchone() is None
+                         and db.execute('SELECT 1 FROM workouts LIMIT 1').fetchone() is not None)
+    if needs_rebuild:
+        rebuild_streaks()
+    message_queue.serve('streak', update_streak)
 
 if __name__ == "__main__":
-    run_streak_service() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='LetsLift streak service')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute streaks from workouts.db and exit')
+    parser.add_argument('--user', help='only rebuild this user')
+    args = parser.parse_args()
+    setup_logging()
+    if args.rebuild:
+        init_db()
+        rebuild_streaks(args.user)
+    else:
+        run_streak_service()
@@ -0,0 +1,45 @@
+"""Writing files that several processes share (app workers and services).
+
+atomic_write() writes to a temporary file next to the target and renames
+it into place, so a reader in another process sees the old content or the
+new one, never a half-written file. locked() holds an advisory lock on a
+sidecar `<path>.lock` for a read-modify-write cycle, so two replicas
+updating the same file don't lose each other's changes. Without fcntl
+(Windows) the lock is a no-op and only atomicity is guaranteed.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def atomic_write(path, data):
+    """Replace path's content with data (str or bytes) in one step."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive advisory lock on path for the duration of the block."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)